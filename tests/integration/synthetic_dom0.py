@@ -0,0 +1,182 @@
+"""Create synthetic Dom0 trees at a configurable scale for benchmarking xen-bugtool
+
+The trees are created in a directory on the host and bind-mounted into the test
+container by tests/integration/test_benchmark.py. They need no Xen: Commands like
+xe, xl and ethtool are fake scripts which sleep and output a configurable volume.
+"""
+
+import gzip
+import os
+import shutil
+import time
+from collections import namedtuple
+
+from .utils import BUGTOOL_DOM0_TEMPL
+
+Dom0Scale = namedtuple(
+    "Dom0Scale",
+    [
+        "nics",  # Number of network interfaces under /sys/class/net
+        "domains",  # Number of domains listed by the fake xl, list_domains and xenstore-ls
+        "log_mb",  # Size of each of xensource.log and SMlog and of each of their rotations
+        "log_rotations",  # Number of rotations of each log, every other one gzipped
+        "db_rows",  # Number of VM rows in the xapi database
+        "blob_depth",  # Depth of the directory tree of /var/xapi/blobs
+        "blob_width",  # Number of subdirectories and files in each directory of it
+        "command_latency",  # Seconds each fake command sleeps
+        "command_kb",  # KiB of output of each fake command (per domain for domain commands)
+    ],
+)
+
+# The scales selected by BUGTOOL_BENCHMARK=<scale>:
+SCALES = {
+    "small": Dom0Scale(16, 20, 8, 2, 2000, 3, 4, 0.01, 4),
+    "medium": Dom0Scale(64, 100, 64, 4, 20000, 4, 6, 0.05, 16),
+    "large": Dom0Scale(256, 500, 512, 6, 200000, 5, 8, 0.1, 64),
+}
+
+# Commands which are faked, the domain commands output command_kb for each domain:
+FAKE_COMMANDS = [
+    "biosdevname", "brctl", "chronyc", "dcbtool", "dmidecode", "ethtool", "fcoeadm", "ip",
+    "iptables", "lldptool", "lspci", "lvs", "multipathd", "pvs", "rpm", "sar", "tc", "vgs",
+]
+FAKE_DOMAIN_COMMANDS = ["list_domains", "xenstore-ls", "xl"]
+
+
+def create_sys_class_net(root, scale):
+    """Create the network interfaces for /sys/class/net: Ethernet NICs and a bridge"""
+
+    for nic in range(scale.nics):
+        path = os.path.join(root, "eth%d" % nic)
+        os.makedirs(path)
+        for name, value in (("type", "1"), ("operstate", "up"), ("address", "00:16:3e:00:00:%02x" % nic)):
+            with open(os.path.join(path, name), "w") as attribute:
+                attribute.write(value + "\n")
+    os.makedirs(os.path.join(root, "xenbr0", "bridge"))
+
+
+def log_block(start, size):
+    """Return about size bytes of syslog lines, one per second from the time start"""
+
+    lines = []
+    total = 0
+    second = 0
+    while total < size:
+        stamp = time.strftime("%b %d %H:%M:%S", time.localtime(start + second))
+        line = "%s xenserver xapi: [debug||%d |dispatch:VM.get_record D:0123456789ab|api] " \
+            "session_id=OpaqueRef:0123-4567 VM.get_record uuid=%08d\n" % (stamp, second, second)
+        lines.append(line)
+        total += len(line)
+        second += 1
+    return "".join(lines).encode(), second
+
+
+def create_log(path, scale, start, compress):
+    """Create a log of log_mb MiB starting at the time start, return the time after it"""
+
+    opener = gzip.open if compress else open
+    with opener(path, "wb") as log:
+        for _ in range(scale.log_mb):
+            block, seconds = log_block(start, 1024 * 1024)
+            log.write(block)
+            start += seconds
+    return start
+
+
+def create_logs(root, scale):
+    """Create xensource.log and SMlog with their rotations (every other one gzipped)"""
+
+    for name in ("xensource.log", "SMlog"):
+        start = time.time() - 86400 * (scale.log_rotations + 1)
+        for rotation in range(scale.log_rotations, -1, -1):
+            path = os.path.join(root, name)
+            if rotation:
+                path += ".%d" % rotation + (".gz" if rotation % 2 == 0 else "")
+            start = create_log(path, scale, start, path.endswith(".gz"))
+            os.utime(path, (start, start))
+
+
+def create_xapi_db(path, scale):
+    """Create a xapi database with db_rows VMs, some of them with secrets to redact"""
+
+    with open(path, "w") as db:
+        db.write('<?xml version="1.0" encoding="UTF-8"?>\n<database><manifest/>')
+        db.write('<table name="secret">')
+        for row in range(scale.db_rows // 100 + 1):
+            db.write('<row ref="OpaqueRef:s%d" uuid="%d" value="secret%d"/>' % (row, row, row))
+        db.write('</table><table name="VM">')
+        for row in range(scale.db_rows):
+            db.write(
+                '<row ref="OpaqueRef:%d" uuid="%08d" name__label="VM %d" power_state="Running" '
+                "other_config=\"(('vm_password'%%.'secret'))\" NVRAM=\"(('EFI-variables'%%.'data'))\" "
+                'snapshot_metadata=""/>' % (row, row, row)
+            )
+        db.write("</table></database>")
+
+
+def create_blobs(root, scale, depth=0):
+    """Create a tree of blob_depth levels with blob_width directories and files in each"""
+
+    for index in range(scale.blob_width):
+        with open(os.path.join(root, "blob%d" % index), "wb") as blob:
+            blob.write(os.urandom(1024))
+        if depth < scale.blob_depth:
+            subdir = os.path.join(root, "dir%d" % index)
+            os.mkdir(subdir)
+            create_blobs(subdir, scale, depth + 1)
+
+
+def create_fake_command(path, latency, size, content="fake output"):
+    """Create a fake command which sleeps for latency seconds and outputs size bytes"""
+
+    with open(path, "w") as command:
+        command.write("#!/bin/sh\nsleep %s\nyes '%s' | head -c %d\n" % (latency, content, size))
+    os.chmod(path, 0o755)  # nosec
+
+
+def create_fake_commands(bindir, scale, xapi_db):
+    """Create the fake commands, xe pool-dump-database outputs the xapi database"""
+
+    shutil.copytree(os.path.join(BUGTOOL_DOM0_TEMPL, "opt/xensource/bin"), bindir)
+    for name in FAKE_COMMANDS:
+        create_fake_command(os.path.join(bindir, name), scale.command_latency, scale.command_kb * 1024)
+    for name in FAKE_DOMAIN_COMMANDS:
+        create_fake_command(
+            os.path.join(bindir, name), scale.command_latency, scale.command_kb * 1024 * scale.domains
+        )
+    with open(os.path.join(bindir, "xe"), "w") as xe:
+        xe.write('#!/bin/sh\nsleep %s\n[ "$1" = pool-dump-database ] && exec cat %s\necho "$@"\n'
+                 % (scale.command_latency, xapi_db))
+    os.chmod(os.path.join(bindir, "xe"), 0o755)  # nosec
+
+
+def create_synthetic_dom0(root, scale):
+    """Create a synthetic Dom0 below root, return the directories to bind-mount into it
+
+    :param root: The directory on the host in which to create the trees.
+    :param scale: The Dom0Scale of the trees to create.
+    :returns: A dict of the mountpoints in the container and their source directories.
+    """
+    mounts = {
+        "/sys/class/net": os.path.join(root, "sys/class/net"),
+        "/var/log": os.path.join(root, "var/log"),
+        "/var/xapi": os.path.join(root, "var/xapi"),
+        "/etc/xensource": os.path.join(root, "etc/xensource"),
+        "/opt/xensource/bin": os.path.join(root, "opt/xensource/bin"),
+    }
+    for source in mounts.values():
+        if not source.endswith("/bin"):
+            os.makedirs(source)
+    create_sys_class_net(mounts["/sys/class/net"], scale)
+    create_logs(mounts["/var/log"], scale)
+    os.makedirs(os.path.join(mounts["/var/xapi"], "blobs"))
+    create_blobs(os.path.join(mounts["/var/xapi"], "blobs"), scale)
+    create_xapi_db(os.path.join(mounts["/var/xapi"], "state.db"), scale)
+    shutil.copytree(
+        os.path.join(BUGTOOL_DOM0_TEMPL, "etc/xensource/bugtool"),
+        os.path.join(mounts["/etc/xensource"], "bugtool"),
+    )
+    with open(os.path.join(mounts["/etc/xensource"], "db.conf"), "w") as db_conf:
+        db_conf.write("[/var/xapi/state.db]\nmode:write_only_on_shutdown\n")
+    create_fake_commands(mounts["/opt/xensource/bin"], scale, "/var/xapi/state.db")
+    return mounts
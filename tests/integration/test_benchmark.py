@@ -0,0 +1,154 @@
+"""tests/integration/test_benchmark.py: Benchmark xen-bugtool on a synthetic Dom0
+
+The benchmark is opt-in as creating the synthetic Dom0 takes time and space:
+
+    BUGTOOL_BENCHMARK=small pytest tests/integration/test_benchmark.py
+
+It runs xen-bugtool --profile in the test container on the synthetic Dom0 of the
+scale (see SCALES in synthetic_dom0.py) and reports the wall time, CPU time, peak RSS
+and archive size, also for each capability. Regressions against the baselines in
+benchmark-baselines.json fail the test. The times are compared as ratios to the
+CPU time of a calibration workload run by the test right before xen-bugtool, so
+the baselines hold on other machines. To store the results as new baselines, set
+BUGTOOL_BENCHMARK_UPDATE=1. BUGTOOL_BENCHMARK_DIR sets the directory for the
+synthetic Dom0 and the report (default: a pytest temporary directory).
+"""
+
+from __future__ import print_function
+
+import bz2
+import json
+import os
+import sys
+import tarfile
+import time
+from subprocess import DEVNULL, Popen
+
+import pytest
+from lxml.etree import parse  # pytype: disable=import-error
+
+from .namespace_container import MS_BIND, mount, umount
+from .synthetic_dom0 import SCALES, create_synthetic_dom0
+from .utils import BUGTOOL_OUTPUT_DIR
+
+BENCHMARK = os.environ.get("BUGTOOL_BENCHMARK", "")
+BASELINES = os.path.join(os.path.dirname(__file__), "benchmark-baselines.json")
+ENTRIES = "xenserver-logs,xenserver-databases,network-status,fcoe,xenserver-domains,blobs"
+REPORT = "benchmark"
+# Factors by which the results may exceed the baselines before the benchmark fails:
+TOLERANCES = {"wall_time": 1.5, "cpu_time": 1.5, "peak_rss_mb": 1.25, "archive_size": 1.1}
+# The results which are compared as ratios to the calibration time:
+TIME_RESULTS = ("wall_time", "cpu_time")
+
+
+@pytest.fixture(scope="function")
+def synthetic_dom0(tmp_path):
+    """Create the synthetic Dom0 of the BUGTOOL_BENCHMARK scale and bind-mount it"""
+
+    if not BENCHMARK:
+        pytest.skip("Set BUGTOOL_BENCHMARK=<%s> to run the benchmark" % "|".join(SCALES))
+    os.makedirs(BUGTOOL_OUTPUT_DIR)  # checked to be empty by the autouse fixture
+    root = os.environ.get("BUGTOOL_BENCHMARK_DIR") or str(tmp_path)
+    mounts = create_synthetic_dom0(os.path.join(root, "dom0"), SCALES[BENCHMARK])
+    # The report may not fit into the tmpfs of the container:
+    mounts[BUGTOOL_OUTPUT_DIR] = os.path.join(root, "output")
+    os.makedirs(mounts[BUGTOOL_OUTPUT_DIR])
+    for mountpoint, source in mounts.items():
+        if not os.path.isdir(mountpoint):
+            os.makedirs(mountpoint)
+        mount(source=source, target=mountpoint, flags=MS_BIND)
+
+    yield BUGTOOL_OUTPUT_DIR + REPORT + ".tar.bz2"
+
+    for mountpoint in reversed(list(mounts)):
+        umount(mountpoint)
+
+
+def run_bugtool(bugtool_script):
+    """Run xen-bugtool --profile, return its wall time, CPU time and peak RSS"""
+
+    env = dict(os.environ, XENRT_BUGTOOL_BASENAME=REPORT)
+    command = [sys.executable, bugtool_script, "-y", "--profile", "--entries=" + ENTRIES]
+    start = os.times().elapsed
+    process = Popen(command, env=env, stdout=DEVNULL, stderr=DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = status
+    assert status == 0
+    return {
+        "wall_time": os.times().elapsed - start,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        "peak_rss_mb": rusage.ru_maxrss / 1024.0,
+    }
+
+
+def calibration_time():
+    """Return the CPU time of a fixed bz2 workload, the unit of the baselines of the times"""
+
+    data = b"".join(b"%d calibration line\n" % n for n in range(200000))
+    start = time.process_time()
+    for _ in range(3):
+        bz2.compress(data, 9)
+    return time.process_time() - start
+
+
+def capability_results(report):
+    """Return the archive size and the time of each capability from the report"""
+
+    capabilities = {}  # type: dict[str, dict[str, float]]
+    with tarfile.open(report) as tar:
+        inventory = parse(tar.extractfile(REPORT + "/inventory.xml"))
+        sizes = {member.name: member.size for member in tar.getmembers()}
+        profile_txt = tar.extractfile(REPORT + "/profile.txt")
+        assert profile_txt
+        profile = profile_txt.read().decode().splitlines()
+    for entry in inventory.iter("inventory-entry"):
+        result = capabilities.setdefault(entry.get("capability"), {"archive_size": 0})
+        result["archive_size"] += sizes.get(entry.get("filename"), 0)
+    for line in profile[1:]:
+        cap, _, wall_time, cpu_time = line.split()[:4]
+        result = capabilities.setdefault(cap, {"archive_size": 0})
+        result.update(wall_time=float(wall_time), cpu_time=float(cpu_time))
+    return capabilities
+
+
+def print_results(results, unit):
+    """Print the results, the results of each capability and the calibration time"""
+
+    print("\nxen-bugtool benchmark, scale %s: %s" % (BENCHMARK, SCALES[BENCHMARK]))
+    print("%-28s %10s %10s %10s %14s" % ("", "wall [s]", "cpu [s]", "rss [MiB]", "archive bytes"))
+    total = [results[key] for key in ("wall_time", "cpu_time", "peak_rss_mb", "archive_size")]
+    print("%-28s %10.2f %10.2f %10.1f %14d" % tuple(["total"] + total))
+    for cap, result in sorted(results["capabilities"].items()):
+        print("%-28s %10.2f %10.2f %10s %14d" % (
+            cap, result.get("wall_time", 0), result.get("cpu_time", 0), "", result["archive_size"]))
+    print("calibration time: %.3f s" % unit)
+
+
+def test_benchmark(bugtool_script, synthetic_dom0):
+    """Benchmark xen-bugtool on a synthetic Dom0 and compare the results to the baselines"""
+
+    results = run_bugtool(bugtool_script)
+    unit = calibration_time()  # after forking xen-bugtool, not to add to its peak RSS
+    results["archive_size"] = os.path.getsize(synthetic_dom0)
+    results["capabilities"] = capability_results(synthetic_dom0)
+    os.unlink(synthetic_dom0)
+    print_results(results, unit)
+    # The times in units of the calibration time of this machine:
+    results.update((key, results[key] / unit) for key in TIME_RESULTS)
+
+    with open(BASELINES) as baselines_file:
+        baselines = json.load(baselines_file)
+    if os.environ.get("BUGTOOL_BENCHMARK_UPDATE"):
+        baselines[BENCHMARK] = {key: round(results[key], 2) for key in TOLERANCES}
+        with open(BASELINES, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=4, sort_keys=True)
+            baselines_file.write("\n")
+        return
+    if BENCHMARK not in baselines:
+        pytest.skip("No baseline for scale %s, set BUGTOOL_BENCHMARK_UPDATE=1" % BENCHMARK)
+    regressions = [
+        "%s: %.2f > %.2f * %.2f" % (key, results[key], factor, baselines[BENCHMARK][key])
+        for key, factor in TOLERANCES.items()
+        if results[key] > factor * baselines[BENCHMARK][key]
+    ]
+    assert not regressions, "Regressions against %s: %s" % (BASELINES, ", ".join(regressions))
@@ -83,6 +83,7 @@ def bugtool(imported_bugtool):
     """Test fixture for unit tests, initializes the bugtool data dict for each test"""
     # Init import_bugtool.data, so each unit test function gets it pristine:
     imported_bugtool.data = {}
+    imported_bugtool.processes = None
     sys.argv = ["xen-bugtool", "--unlimited"]
 
     yield imported_bugtool  # provide the bugtool to the test function
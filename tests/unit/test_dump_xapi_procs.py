@@ -1,5 +1,8 @@
 """This module contains the unit tests for the dump_xapi_procs function"""
 
+import threading
+import time
+
 
 def test_dump_xapi_subprocess_info(bugtool, fs):
     """Test the dump_xapi_subprocess_info() function to perform as expected"""
@@ -26,3 +29,60 @@ def test_dump_xapi_subprocess_info(bugtool, fs):
     # Assert the expected result
 
     assert bugtool.dump_xapi_subprocess_info("cap") == expected_result
+
+
+def test_process_table(bugtool, fs, mocker):
+    """Test that pidof() and fd_usage() share one snapshot of the process table"""
+
+    fs.create_file("/proc/2/status", contents="Name: tapdisk\nPPid: 1\n")
+    fs.create_file("/proc/2/cmdline", contents="/usr/bin/tapdisk\0-D\0")
+    fs.create_symlink("/proc/2/exe", "/usr/bin/tapdisk")
+    fs.create_symlink("/proc/2/fd/0", "/dev/null")
+    fs.create_symlink("/proc/2/fd/1", "/dev/null")
+    fs.create_file("/proc/3/status", contents="PPid: 2\n")
+    fs.create_file("/proc/3/cmdline", contents="/usr/bin/tapdisk\0")
+    fs.create_symlink("/proc/3/exe", "/usr/bin/tapdisk")
+    fs.create_symlink("/proc/3/fd/0", "/dev/null")
+    fs.create_dir("/proc/4")  # A process which disappeared
+    fs.create_file("/proc/self/status", contents="PPid: 1\n")
+
+    listdir = mocker.spy(bugtool.os, "listdir")
+    assert sorted(bugtool.pidof("tapdisk")) == [2, 3]
+    assert bugtool.pidof("iscsid") == []
+    assert bugtool.process_table()["2"].children == ["3"]
+    fd_usage = bugtool.fd_usage("cap")
+    assert fd_usage.startswith("Error: Pid 4 disappeared\n")
+    assert fd_usage.endswith("2: ['/usr/bin/tapdisk -D']\n1: ['/usr/bin/tapdisk']\n")
+    # /proc was listed once, and the fds of each process:
+    assert sorted(call.args[0] for call in listdir.call_args_list) == [
+        "/proc",
+        "/proc/2/fd",
+        "/proc/3/fd",
+        "/proc/4/fd",
+    ]
+
+
+def test_process_table_threads(bugtool, fs, mocker):
+    """Test that functions running in parallel threads only get the complete process table"""
+
+    for pid in range(2, 12):
+        fs.create_file("/proc/%d/status" % pid, contents="PPid: 1\n")
+    process_info = bugtool.ProcessInfo
+
+    def slow_process_info(pid):
+        time.sleep(0.01)  # Let the other threads call process_table() while it is read
+        return process_info(pid)
+
+    mocker.patch.object(bugtool, "ProcessInfo", side_effect=slow_process_info)
+    sizes = []
+
+    def read_table():
+        sizes.append(len(bugtool.process_table()))
+
+    threads = [threading.Thread(target=read_table) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sizes == [10, 10, 10, 10]
+    assert bugtool.ProcessInfo.call_count == 10
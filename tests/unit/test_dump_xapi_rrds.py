@@ -1,10 +1,10 @@
 """Test: test_dump_xapi_rrds"""
 
-from email.message import Message
+import io
+import os
 
 import pytest
 from mock import MagicMock
-from urllib.request import HTTPError
 
 
 @pytest.fixture
@@ -25,7 +25,7 @@ def mock_session1():
 
     # Simulates that the pool has 3 VMs, one of them is a template:
     session.xenapi.VM.get_all_records.return_value = {
-        "invalid VM: mock_urlopen will return 404 on opening the 1st URL": {
+        "invalid VM: MockHTTPConnection returns 404 for its RRD": {
             "uuid": "0",
             "is_a_template": False,
             "power_state": "Suspended",
@@ -58,25 +58,66 @@ def mock_session1():
     return session
 
 
-@pytest.fixture
-def mock_urlopen():
-    """Return a mock urlopen() that returns different mock RRD data on each call"""
+class MockHTTPResponse:
+    """Mock http.client.HTTPResponse with the given status and body"""
+
+    def __init__(self, status, reason, body):
+        self.status = status
+        self.reason = reason
+        self.body = io.BytesIO(body)
+
+    def read(self, size=-1):
+        """Return up to size bytes of the body (default: all of it)"""
+        return self.body.read(size)
+
+
+class MockHTTPConnection:
+    """Mock http.client.HTTPConnection which returns the RRDs of MOCK_RRDS"""
+
+    instances = []  # type: list[MockHTTPConnection]
+    requests = []  # type: list[str]
+
+    def __init__(self, host, timeout):
+        assert host == "localhost"
+        assert timeout == 5
+        self.url = ""
+        self.closed = False
+        MockHTTPConnection.instances.append(self)
 
-    mock_response = MagicMock()
-    mock_response.read.side_effect = [b"mock_rrd1", b"mock_rrd2", b"mock_rrd3"]
+    def request(self, method, url):
+        """Record the requested URL for getresponse()"""
+        assert method == "GET"
+        self.url = url
+        MockHTTPConnection.requests.append(url)
 
-    mock_urlopen = MagicMock(return_value=mock_response)
+    def getresponse(self):
+        """Return the mock RRD of the requested URL, or HTTP 404 for the RRD of uuid 0"""
+        if self.url == "/vm_rrd?session_id=id&uuid=0":
+            return MockHTTPResponse(404, "Not Found", b"")
+        return MockHTTPResponse(200, "OK", MOCK_RRDS[self.url])
 
-    # Mock the urlopen() to return the mock_response with different data on each call
-    side_effect = [HTTPError("url", 404, "Not Found", Message(), None)]
+    def close(self):
+        """Record that the connection was closed"""
+        self.closed = True
 
-    side_effect += [mock_response] * 3
-    mock_urlopen.side_effect = side_effect
 
-    return mock_urlopen
+MOCK_RRDS = {
+    "/vm_rrd?session_id=id&uuid=1": b"mock_rrd1",
+    "/vm_rrd?session_id=id&uuid=2": b"mock_rrd2" * 100000,
+    "/host_rrd?session_id=id": b"mock_rrd3",
+}
 
 
-def assert_mock_session1(bugtool, mock_urlopen):
+@pytest.fixture
+def mock_connection(mocker):
+    """Patch HTTPConnection with MockHTTPConnection and return it"""
+
+    MockHTTPConnection.instances = []
+    MockHTTPConnection.requests = []
+    return mocker.patch("http.client.HTTPConnection", side_effect=MockHTTPConnection)
+
+
+def assert_mock_session1(bugtool):
     """Assert the results expected from the mock_session1() fixture.
 
     The pool has 3 VMs, one of which is not resident and one template.
@@ -84,18 +125,12 @@ def assert_mock_session1(bugtool, mock_urlopen):
     Because the session was run on the pool master, dump_xapi_rrds() is expected
     fetch the RRDs of resident VMs on any host and of the pool master.
     """
-    # Expect to see 3 calls to urlopen, one for each VM and one for the host
-    assert mock_urlopen.return_value.read.call_count == 3
-
-    # Assert that the RRDs of both VM are fetched
-    mock_urlopen.assert_any_call(
-        "http://localhost/vm_rrd?session_id=id&uuid=1",
-        timeout=5,
-    )
-    mock_urlopen.assert_any_call(
-        "http://localhost/vm_rrd?session_id=id&uuid=2",
-        timeout=5,
+    # Expect requests for the RRDs of the 3 VMs and of the host:
+    assert sorted(MockHTTPConnection.requests) == sorted(
+        ["/vm_rrd?session_id=id&uuid=0"] + list(MOCK_RRDS)
     )
+    # All connections were closed:
+    assert all(conn.closed for conn in MockHTTPConnection.instances)
 
     # Check the keys of the data dictionary
     files = sorted(bugtool.data.keys())
@@ -105,9 +140,13 @@ def assert_mock_session1(bugtool, mock_urlopen):
     expected_caps = ["persistent-stats"] * 3
     assert [key["cap"] for key in bugtool.data.values()] == expected_caps
 
-    # Call the func_output() functions and check the return values
-    values = [key["func"]("") for key in bugtool.data.values() if "func" in key]
-    assert sorted(values) == [b"mock_rrd1", b"mock_rrd2", b"mock_rrd3"]
+    # The RRDs were spooled for archiving into files which are closed until read:
+    assert all(key["output"].file.closed for key in bugtool.data.values())
+    values = [key["output"].getvalue() for key in bugtool.data.values()]
+    assert values == list(MOCK_RRDS.values())
+    for key in bugtool.data.values():
+        key["output"].close()
+        assert not os.path.exists(key["output"].filename)
 
     with open(bugtool.XEN_BUGTOOL_LOG, "r") as f:
         log = f.read()
@@ -119,19 +158,15 @@ def assert_mock_session1(bugtool, mock_urlopen):
         f.write("")
 
 
-def run_dump_xapi_rrds(mocker, bugtool, mock_session, mock_urlopen):
+def run_dump_xapi_rrds(mocker, bugtool, mock_session):
     """Run the bugtool function dump_xapi_rrds(entries) with the given mocks."""
-    # Patch the urlopen, xapi_local_session and entries
-    mocker.patch("bugtool.urlopen", side_effect=mock_urlopen)
+    # Patch the xapi_local_session and entries
     mocker.patch("bugtool.xapi_local_session", return_value=mock_session)
     mocker.patch("bugtool.entries", [bugtool.CAP_PERSISTENT_STATS])
 
     # Run the function
     bugtool.dump_xapi_rrds(bugtool.entries)
 
-    # Check if host RRD is fetched
-    mock_urlopen.assert_any_call("http://localhost/host_rrd?session_id=id")
-
     # Check the calls to xapi_local_session
     assert mock_session.xenapi.VM.get_all_records.call_count == 1
     assert mock_session.xenapi.pool.get_all_records.call_count == 1
@@ -139,15 +174,39 @@ def run_dump_xapi_rrds(mocker, bugtool, mock_session, mock_urlopen):
     assert mock_session.xenapi.session.logout.call_count == 1
 
 
-def test_dump_xapi_rrds_master(mocker, isolated_bugtool, mock_session1, mock_urlopen):
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_dump_xapi_rrds_master(mocker, isolated_bugtool, mock_session1, mock_connection, jobs):
     """Test dump_xapi_rrds() on a pool master with 2 VMs in the pool.
 
     Test the bugtool function dump_xapi_rrds(entries) to perform as expected
     with mock_session1 which simulates a pool with 2 VMs and a pool master.
     """
 
-    run_dump_xapi_rrds(mocker, isolated_bugtool, mock_session1, mock_urlopen)
-    assert_mock_session1(isolated_bugtool, mock_urlopen)
+    mocker.patch.object(isolated_bugtool, "max_parallel_procs", jobs)
+    run_dump_xapi_rrds(mocker, isolated_bugtool, mock_session1)
+    assert_mock_session1(isolated_bugtool)
+    # Each thread of the pool reuses its connection for the following requests:
+    assert 1 <= len(MockHTTPConnection.instances) <= jobs
+    assert mock_connection.call_count == len(MockHTTPConnection.instances)
+
+
+def test_dump_xapi_rrds_time_limit(mocker, isolated_bugtool, mock_session1, mock_connection):
+    """Test that dump_xapi_rrds() stops fetching RRDs when the time limit is exceeded"""
+
+    bugtool = isolated_bugtool
+    mocker.patch.object(bugtool, "unlimited_time", False)
+    # Set the time limit of the capability to have passed already:
+    cap = list(bugtool.caps[bugtool.CAP_PERSISTENT_STATS])
+    cap[bugtool.MAX_TIME] = -1
+    mocker.patch.dict(bugtool.caps, {bugtool.CAP_PERSISTENT_STATS: tuple(cap)})
+    run_dump_xapi_rrds(mocker, isolated_bugtool, mock_session1)
+
+    assert isolated_bugtool.data == {}
+    assert not mock_connection.called
+    with open(isolated_bugtool.XEN_BUGTOOL_LOG, "r+") as f:
+        assert f.read() == "Omitted RRDs: The time limit of persistent-stats was exceeded\n"
+        f.seek(0)
+        f.truncate()
 
 
 def test_log_exceptions(isolated_bugtool, capsys):
@@ -0,0 +1,87 @@
+"""tests/unit/test_ethtool.py: Test the ethtool -i and -S output using SIOCETHTOOL ioctls"""
+
+import ctypes
+import errno
+import os
+import struct
+
+STATS = [(b"rx_packets", 1234), (b"tx_packets", 5678), (b"rx_errors", 0)]
+
+
+def fake_ethtool_ioctl(bugtool, interfaces):
+    """Return a fake fcntl.ioctl() which answers the ethtool requests for the interfaces"""
+
+    def ioctl(_, request, ifreq):
+        assert request == bugtool.SIOCETHTOOL
+        name, pointer = struct.unpack_from("16sP", ifreq)
+        if name.rstrip(b"\0").decode() not in interfaces:
+            raise OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+        command = ctypes.c_uint32.from_address(pointer).value
+        if command == bugtool.ETHTOOL_GDRVINFO:
+            result = struct.pack(
+                "=I32s32s32s32s32s12sIIIII", command, b"ixgbe", b"5.19.9", b"0x800006e5", b"0000:01:00.0",
+                b"", b"", 0, len(STATS), 0, 512, 1024,
+            )
+        elif command == bugtool.ETHTOOL_GSSET_INFO:
+            result = struct.pack("=IIQI", command, 0, 1 << bugtool.ETH_SS_STATS, len(STATS))
+        elif command == bugtool.ETHTOOL_GSTRINGS:
+            result = struct.pack("=III", command, bugtool.ETH_SS_STATS, len(STATS))
+            result += b"".join(struct.pack("32s", name) for name, _ in STATS)
+        else:
+            assert command == bugtool.ETHTOOL_GSTATS
+            result = struct.pack("=II", command, len(STATS))
+            result += b"".join(struct.pack("=Q", value) for _, value in STATS)
+        ctypes.memmove(pointer, result, len(result))
+
+    return ioctl
+
+
+def test_ethtool_output(bugtool, mocker, tmp_path):
+    """Assert the output of ethtool -i and -S, and running ethtool when the ioctls fail"""
+
+    mocker.patch.object(bugtool.fcntl, "ioctl", fake_ethtool_ioctl(bugtool, ["eth0"]))
+    assert bugtool.EthtoolOutput("-i", "eth0")(bugtool.CAP_NETWORK_STATUS) == (
+        b"driver: ixgbe\n"
+        b"version: 5.19.9\n"
+        b"firmware-version: 0x800006e5\n"
+        b"expansion-rom-version: \n"
+        b"bus-info: 0000:01:00.0\n"
+        b"supports-statistics: yes\n"
+        b"supports-test: no\n"
+        b"supports-eeprom-access: yes\n"
+        b"supports-register-dump: yes\n"
+        b"supports-priv-flags: no\n"
+    )
+    assert bugtool.EthtoolOutput("-S", "eth0")(bugtool.CAP_NETWORK_STATUS) == (
+        b"NIC statistics:\n     rx_packets: 1234\n     tx_packets: 5678\n     rx_errors: 0\n"
+    )
+
+    ethtool = tmp_path / "ethtool"
+    ethtool.write_text('#!/bin/sh\necho "ethtool $*"\n')
+    os.chmod(str(ethtool), 0o755)  # nosec
+    mocker.patch.object(bugtool, "ETHTOOL", str(ethtool))
+    mocker.patch.object(bugtool, "log")
+    assert bugtool.EthtoolOutput("-S", "vif1.0")(bugtool.CAP_NETWORK_STATUS) == b"ethtool -S vif1.0\n"
+
+
+def test_ethtool_output_size(bugtool, mocker):
+    """Assert that like the output of commands, ethtool outputs are not counted in the cap size"""
+
+    mocker.patch.object(bugtool.fcntl, "ioctl", fake_ethtool_ioctl(bugtool, ["eth0"]))
+    cap = bugtool.CAP_NETWORK_STATUS
+    max_size = bugtool.caps[cap][bugtool.MAX_SIZE]
+    mocker.patch.object(bugtool, "unlimited_data", False)
+    mocker.patch.object(bugtool, "entries", [cap])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.object(bugtool, "log")
+    mocker.patch.dict(bugtool.cap_sizes, {cap: max_size})  # Filled by other func_output() entries
+    bugtool.func_output(cap, "ethtool -S eth0", bugtool.EthtoolOutput("-S", "eth0"), command=True)
+    bugtool.func_output(cap, "func", lambda _: "func output")
+
+    archive = mocker.Mock()
+    bugtool.collect_data("report", archive)
+    # The output of the func is omitted, the ethtool output is archived:
+    assert [call[0][0] for call in archive.add_path_with_data.call_args_list] == [
+        bugtool.construct_filename("report", "ethtool -S eth0", bugtool.data["ethtool -S eth0"])
+    ]
+    assert bugtool.cap_sizes[cap] == max_size
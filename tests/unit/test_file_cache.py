@@ -0,0 +1,96 @@
+"""tests/unit/test_file_cache.py: Unit-Test the FileCache of compressed files"""
+
+import gzip
+import hashlib
+import os
+import shutil
+import tarfile
+import time
+
+import pytest
+
+
+def create_tarball(bugtool, name, files):
+    """Create a tar.gz tarball of the files and return the md5sums returned for them"""
+
+    archive = bugtool.TarOutput(name, "tar.gz", -1)
+    md5sums = [archive.addRealFile(path.name, str(path)) for path in files]
+    assert archive.close()
+    return md5sums
+
+
+def test_file_cache(bugtool, tmp_path, mocker):
+    """Assert that the compressed data of files is cached and spliced into later tarballs"""
+
+    bugtool.BUG_DIR = tmp_path.as_posix()
+    mocker.patch.object(bugtool, "cache_size", 1024 * 1024)
+    mocker.patch.object(bugtool, "max_parallel_procs", 2)
+    mocker.patch.dict(bugtool.BlockCompressor.block_sizes, {"gz": 1000})
+    old = time.time() - bugtool.CACHE_MIN_AGE - 60
+    static, rotated, recent = tmp_path / "static.conf", tmp_path / "old.log.1.gz", tmp_path / "recent.log"
+    static.write_bytes(b"static configuration\n" * 500)
+    rotated.write_bytes(gzip.compress(os.urandom(5000)))
+    recent.write_bytes(b"recent log line\n" * 500)
+    for path in (static, rotated):
+        os.utime(str(path), (old, old))
+    files = [static, rotated, recent]
+    expected = [path.read_bytes() for path in files]
+    md5sums = create_tarball(bugtool, "first", files)
+    assert md5sums == [hashlib.md5(data).hexdigest() for data in expected]  # nosec
+
+    # The cache has the static files, but not the recently modified file:
+    cache = bugtool.FileCache(str(tmp_path / bugtool.CACHE_DIR), 0)
+    assert sorted(cache.cached_files) == sorted([str(static), str(rotated)])
+    assert sorted(cache.blobs) == sorted([md5sums[0] + ".gz6", md5sums[1] + ".gz0"])
+
+    # Change the content of the static file without changing the cache key: If the
+    # cached data is used, the second tarball contains the original content:
+    stat = static.stat()
+    static.write_bytes(b"STATIC CONFIGURATION\n" * 500)
+    os.utime(str(static), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert create_tarball(bugtool, "second", files) == md5sums
+
+    for name in ("first", "second"):
+        with tarfile.open(str(tmp_path / (name + ".tar.gz"))) as tar:
+            assert tar.getnames() == [path.name for path in files]
+            for path, data in zip(files, expected):
+                member = tar.extractfile(path.name)
+                assert member
+                assert member.read() == data
+        os.unlink(str(tmp_path / (name + ".tar.gz")))
+
+    # The cache is only accessible by its owner, it has the data of the collected files:
+    directory = tmp_path / bugtool.CACHE_DIR
+    assert directory.stat().st_mode & 0o777 == 0o700
+    assert all(path.stat().st_mode & 0o777 == 0o600 for path in directory.iterdir())
+
+    # A tarball of only some of the files keeps the cache entries of the others:
+    create_tarball(bugtool, "third", [rotated])
+    os.unlink(str(tmp_path / "third.tar.gz"))
+    cache = bugtool.FileCache(str(directory), 0)
+    assert sorted(cache.cached_files) == sorted([str(static), str(rotated)])
+
+    # Closing a cache with a size limit of 0 evicts all blobs and their entries,
+    # also when no file was archived:
+    cache.close()
+    assert bugtool.FileCache(str(directory), 0).cached_files == {}
+    assert os.listdir(str(tmp_path / bugtool.CACHE_DIR)) == [bugtool.CACHE_INDEX]
+    shutil.rmtree(str(tmp_path / bugtool.CACHE_DIR))
+
+
+def test_file_cache_read_error(bugtool, tmp_path, mocker):
+    """Assert that the compressed blocks are no longer captured when reading a file fails"""
+
+    bugtool.BUG_DIR = tmp_path.as_posix()
+    mocker.patch.object(bugtool, "cache_size", 1024 * 1024)
+    old = time.time() - bugtool.CACHE_MIN_AGE - 60
+    static = tmp_path / "static.conf"
+    static.write_bytes(b"static configuration\n" * 500)
+    os.utime(str(static), (old, old))
+    archive = bugtool.TarOutput("report", "tar.gz", -1)
+    mocker.patch.object(tarfile, "copyfileobj", side_effect=OSError("Input/output error"))
+    with pytest.raises(OSError):
+        archive.addRealFile(static.name, str(static))
+    assert archive.compressor.captured is None
+    mocker.stopall()
+    assert archive.close()
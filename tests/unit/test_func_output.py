@@ -0,0 +1,43 @@
+"""tests/unit/test_func_output.py: Test running the func_output() funcs in the JobPool"""
+
+import os
+import threading
+
+
+def test_func_pool_timeout(bugtool, mocker):
+    """Assert that a func exceeding the MAX_TIME of its capability is abandoned"""
+
+    mocker.patch.object(bugtool, "unlimited_time", False)
+    release = threading.Event()
+
+    def slow(_):
+        release.wait(10)
+        return b"too late"
+
+    pool = bugtool.JobPool(1)
+    slow_entry = {"cap": "slow", "func": slow}
+    slow_job = pool.submit("slow", slow_entry, bugtool.call_func, "func", 1)
+    fast_entry = {"cap": "fast", "func": lambda cap: cap.encode()}
+    fast_job = pool.submit("fast", fast_entry, bugtool.call_func, "func", 1)
+    pool.start()
+
+    # The fast func is run by a new thread when the slow func is abandoned:
+    assert slow_job.result().getvalue() == b"** timeout **\n"
+    assert slow_entry["truncated"]
+    assert fast_job.result().getvalue() == b"fast"
+    assert fast_job.duration() < 1
+    release.set()
+
+
+def test_multipathd_topology_timeout(bugtool, mocker, tmp_path):
+    """Assert that a stuck multipathd -k is killed after the MAX_TIME of CAP_MULTIPATH"""
+
+    mocker.patch.object(bugtool, "unlimited_time", False)
+    multipathd = tmp_path / "multipathd"
+    multipathd.write_text("#!/bin/sh\necho topology\nexec /bin/sleep 10\n")
+    os.chmod(str(multipathd), 0o755)  # nosec
+    mocker.patch.object(bugtool, "MULTIPATHD", str(multipathd))
+    mocker.patch.dict(bugtool.caps)
+    bugtool.cap(bugtool.CAP_MULTIPATH, max_time=1)
+
+    assert bugtool.multipathd_topology(bugtool.CAP_MULTIPATH) == "topology\n\n** timeout **\n"
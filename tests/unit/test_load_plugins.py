@@ -1,5 +1,10 @@
 """Regression tests for bugtool.load_plugins()"""
 
+import json
+import os
+import shutil
+from xml.dom.minidom import parse as minidom_parse
+
 
 def test_load_plugins(bugtool, dom0_template):
     """Assert () returning arrays of the  in the dom0-template"""
@@ -53,22 +58,110 @@ def test_load_plugins(bugtool, dom0_template):
 
     # Assert the tree_output entries for /proc/sys/fs/inotify:
     entry_one, entry_two = bugtool.directory_specifications["/proc/sys/fs/inotify"]
-    cap, regex, negate = entry_one
+    cap, regex, negate, redaction = entry_one
     assert cap == "mock"
     assert regex.pattern == ".*user_.*"
     assert negate
-    cap, regex, negate = entry_two
+    assert redaction is None
+    cap, regex, negate, redaction = entry_two
     assert cap == "mock"
     assert regex.pattern == ".*max_user_instances.*"
     assert not negate
 
     # Assert the tree_output entry for /proc/sys/fs/epoll:
     entry_one, entry_two = bugtool.directory_specifications["/proc/sys/fs/epoll"]
-    cap, regex, negate = entry_one
+    cap, regex, negate, redaction = entry_one
     assert cap == "mock"
     assert regex.pattern == ".*ax_user_watches"
     assert not negate
-    cap, regex, negate = entry_two
+    cap, regex, negate, redaction = entry_two
     assert cap == "mock"
     assert regex.pattern == "no"
     assert not negate
+
+
+def test_plugin_redaction(bugtool, dom0_template, mocker, tmp_path):
+    """Assert that the <redact> rules of <files> and <directory> become RedactionFilters"""
+
+    plugin_dir = str(tmp_path / "bugtool")
+    shutil.copytree(dom0_template + "/etc/xensource/bugtool", plugin_dir)
+    stuff_xml = os.path.join(plugin_dir, "mock", "stuff.xml")
+    with open(stuff_xml) as f:
+        stuff = f.read()
+    stuff = stuff.replace(
+        "<files>/etc/group</files>",
+        '<files>/etc/group<redact pattern="^(\\w+):x:" replace="\\1:REMOVED:"/></files>'
+        '<directory pattern=".*">/etc/ssh<redact pattern="(Key )\\S+" replace="\\1X"/>'
+        "</directory>",
+    )
+    with open(stuff_xml, "w") as f:
+        f.write(stuff)
+    mocker.patch.object(bugtool, "PLUGIN_DIR", plugin_dir)
+    mocker.patch.object(bugtool, "plugin_manifest", None)
+    mocker.patch.object(bugtool, "entries", ["mock"])
+    mocker.patch.dict(bugtool.cap_sizes, {"mock": 0})
+    bugtool.load_plugins(just_capabilities=False)
+
+    assert bugtool.data["/etc/group"]["filter"].redact(b"root:x:0:\n") == b"root:REMOVED:0:\n"
+    ((_, _, _, redaction),) = bugtool.directory_specifications["/etc/ssh"]
+    assert redaction.redact(b"Key secret\n") == b"Key X\n"
+
+
+def test_plugin_manifest(bugtool, dom0_template, mocker, tmp_path):
+    """Assert that the plugins are parsed only when they changed since the manifest"""
+
+    plugin_dir = str(tmp_path / "bugtool")
+    shutil.copytree(dom0_template + "/etc/xensource/bugtool", plugin_dir)
+    mocker.patch.object(bugtool, "PLUGIN_DIR", plugin_dir)
+    mocker.patch.object(bugtool, "BUG_DIR", str(tmp_path))
+    mocker.patch.object(bugtool, "plugin_manifest", None)
+    mocker.patch.object(bugtool, "entries", ["mock"])
+    mocker.patch.dict(bugtool.cap_sizes, {"mock": 0})
+    bugtool.load_plugins(just_capabilities=False)
+    expected = dict(bugtool.data)
+    manifest = tmp_path / bugtool.CACHE_DIR / bugtool.PLUGIN_MANIFEST
+    assert manifest.exists()
+
+    # Both the manifest kept in memory and the stored manifest are used unparsed:
+    parse = mocker.patch("xml.dom.minidom.parse", side_effect=AssertionError)
+    for _ in range(2):
+        bugtool.data = {}
+        bugtool.cap_sizes["mock"] = 0
+        bugtool.load_plugins(just_capabilities=False)
+        assert list(bugtool.data) == list(expected)
+        bugtool.plugin_manifest = None
+
+    # A changed plugin file is parsed again, for the capabilities only their root elements:
+    stuff = plugin_dir + "/mock/stuff.xml"
+    os.utime(stuff, (0, 0))
+    bugtool.load_plugins(just_capabilities=True)
+    assert not parse.called
+    assert bugtool.plugin_manifest_valid(json.loads(manifest.read_text()))
+    assert not bugtool.plugin_manifest_valid(json.loads(manifest.read_text()), collect=True)
+    parse.side_effect = minidom_parse
+    bugtool.load_plugins(just_capabilities=False)
+    assert parse.call_args_list == [mocker.call(stuff)]
+    assert bugtool.plugin_manifest_valid(json.loads(manifest.read_text()), collect=True)
+
+
+def test_load_plugins_malformed(bugtool, dom0_template, mocker, tmp_path):
+    """Assert that a plugin which cannot be parsed is skipped, and the other plugins are loaded"""
+
+    plugin_dir = tmp_path / "bugtool"
+    shutil.copytree(dom0_template + "/etc/xensource/bugtool", str(plugin_dir))
+    (plugin_dir / "broken").mkdir()
+    (plugin_dir / "broken.xml").write_text('<capability max_size="1"/>')
+    (plugin_dir / "broken" / "stuff.xml").write_text("<collect><files>/etc/hosts</collect>")
+    mocker.patch.object(bugtool, "PLUGIN_DIR", str(plugin_dir))
+    mocker.patch.object(bugtool, "BUG_DIR", str(tmp_path / "missing"))
+    mocker.patch.object(bugtool, "plugin_manifest", None)
+    mocker.patch.object(bugtool, "entries", ["mock", "broken"])
+    mocker.patch.dict(bugtool.caps)
+    mocker.patch.dict(bugtool.cap_sizes, {"mock": 0})
+    log = mocker.patch.object(bugtool, "log")
+
+    bugtool.load_plugins(just_capabilities=False)
+    assert "broken" not in bugtool.caps
+    assert "/etc/passwd" in bugtool.data and "/etc/hosts" not in bugtool.data
+    assert log.call_args[0][0].startswith("Skipping plugin broken: ")
+    assert log.call_args[1] == {"print_output": False}
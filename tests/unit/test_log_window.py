@@ -0,0 +1,120 @@
+"""tests/unit/test_log_window.py: Unit-Test collecting the logs of a time window (--from and --to)"""
+
+import gzip
+import hashlib
+import os
+import time
+
+
+def syslog_lines(start, count):
+    """Return count syslog lines, one per minute from the local time start, with continuations"""
+    lines = []
+    for minute in range(count):
+        stamp = time.strftime("%b %e %H:%M:%S", time.localtime(start + minute * 60)).encode()
+        lines.append(stamp + b" host xapi: [debug] minute %d\n" % minute)
+        lines.append(b" continued %d\n" % minute)
+    return lines
+
+
+def test_log_window(bugtool, tmp_path, mocker):
+    """Assert that only the lines and rotations of logs in the time window are collected"""
+
+    mocker.patch.object(bugtool, "LOG_SCAN_SIZE", 256)  # Bisect the small test logs
+    start = time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, -1))
+    lines = syslog_lines(start, 1000)
+    log = tmp_path / "xensource.log"
+    log.write_bytes(b"".join(lines))
+    os.utime(str(log), (start + 60000, start + 60000))
+
+    window = bugtool.LogWindow(start + 100 * 60, start + 109 * 60)
+    assert window.includes(str(log))
+    assert window.extract(str(log)).getvalue() == b"".join(lines[200:220])
+
+    # Without an end, up to the end of the log:
+    window = bugtool.LogWindow(start + 990 * 60)
+    assert window.extract(str(log)).getvalue() == b"".join(lines[1980:])
+
+    # A window between two lines gives no lines:
+    window = bugtool.LogWindow(start + 100 * 60 + 1, start + 100 * 60 + 59)
+    assert window.extract(str(log)).getvalue() == b""
+
+    # Gzipped rotations are decompressed, filtered and compressed again:
+    rotation = tmp_path / "xensource.log.1.gz"
+    rotation.write_bytes(gzip.compress(b"".join(lines)))
+    os.utime(str(rotation), (start + 60000, start + 60000))
+    window = bugtool.LogWindow(start + 100 * 60, start + 109 * 60)
+    assert gzip.decompress(window.extract(str(rotation)).getvalue()) == b"".join(lines[200:220])
+
+    # Rotations older than the window and rotations newer than the window are skipped:
+    assert not bugtool.LogWindow(start + 60001).includes(str(rotation))
+    assert not bugtool.LogWindow(0, start - 1).includes(str(rotation))
+
+    # Logs without timestamps are collected completely:
+    wtmp = tmp_path / "wtmp"
+    wtmp.write_bytes(b"\0" * 1000)
+    assert bugtool.LogWindow(0, start).extract(str(wtmp)) is None
+
+
+def test_log_output(bugtool, tmp_path, mocker):
+    """Assert that log_output() adds the logs in the window and collect_data() their lines"""
+
+    start = time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, -1))
+    lines = syslog_lines(start, 10)
+    (tmp_path / "SMlog").write_bytes(b"".join(lines))
+    os.utime(str(tmp_path / "SMlog"), (start + 600, start + 600))
+    (tmp_path / "SMlog.1").write_bytes(b"".join(syslog_lines(start - 86400, 10)))
+    os.utime(str(tmp_path / "SMlog.1"), (start - 86000, start - 86000))
+    cap = bugtool.CAP_XENSERVER_LOGS
+    mocker.patch.object(bugtool, "entries", [cap])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.dict(bugtool.cap_sizes, {cap: 0})
+    mocker.patch.object(bugtool, "log_window", bugtool.LogWindow(bugtool.parse_time("2024-03-01 12:05")))
+
+    bugtool.log_output(cap, [str(tmp_path / "SMlog*")])
+    assert list(bugtool.data) == [str(tmp_path / "SMlog")]
+
+    archive = mocker.Mock()
+    bugtool.collect_data("report", archive)
+    (name, output), _ = archive.add_path_with_data.call_args
+    assert name == "report" + str(tmp_path / "SMlog")
+    expected_md5 = hashlib.md5(b"".join(lines[10:])).hexdigest()  # nosec
+    assert bugtool.data[str(tmp_path / "SMlog")]["md5"] == output.hexdigest() == expected_md5
+
+
+def test_log_window_size_limit(bugtool, tmp_path, mocker):
+    """Assert that only the size of the lines in the window is charged to the size limit"""
+
+    start = time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, -1))
+    lines = syslog_lines(start, 1000)
+    for name in ("SMlog", "xensource.log"):
+        (tmp_path / name).write_bytes(b"".join(lines))
+        os.utime(str(tmp_path / name), (start + 60000, start + 60000))
+    cap = bugtool.CAP_XENSERVER_LOGS
+    limit = len(b"".join(lines)) // 2  # The logs exceed it, their lines in the window do not
+    mocker.patch.dict(bugtool.caps, {cap: bugtool.caps[cap][:bugtool.MAX_SIZE] + (limit,)
+                                     + bugtool.caps[cap][bugtool.MAX_SIZE + 1:]})
+    mocker.patch.object(bugtool, "unlimited_data", False)
+    mocker.patch.object(bugtool, "entries", [cap])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.dict(bugtool.cap_sizes, {cap: 0})
+    mocker.patch.object(bugtool, "log_window", bugtool.LogWindow(start + 100 * 60, start + 109 * 60))
+
+    bugtool.log_output(cap, [str(tmp_path / "SMlog"), str(tmp_path / "xensource.log")])
+    assert bugtool.cap_sizes[cap] == 0
+    archive = mocker.Mock()
+    bugtool.collect_data("report", archive)
+    assert archive.add_path_with_data.call_count == 2
+    assert bugtool.cap_sizes[cap] == 2 * len(b"".join(lines[200:220]))
+
+
+def test_next_timestamp_bounded(bugtool, tmp_path, mocker):
+    """Assert that lines without timestamps are scanned for at most LOG_SCAN_SIZE bytes"""
+
+    mocker.patch.object(bugtool, "LOG_SCAN_SIZE", 256)
+    start = time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, -1))
+    log = tmp_path / "daemon.log"
+    log.write_bytes(b"no timestamp\n" * 1000 + b"".join(syslog_lines(start, 1)))
+    with open(str(log), "rb") as f:
+        timestamp, position = bugtool.LogWindow(0).next_timestamp(f, time.localtime(start), 1 << 30)
+        assert timestamp is None
+        assert position == f.tell() == 256
@@ -6,7 +6,10 @@ import sys
 import tarfile
 import zipfile
 
+from xml.dom.minidom import getDOMImplementation
+
 import pytest
+from lxml.etree import fromstring  # pytype: disable=import-error
 
 # sourcery skip: dont-import-test-modules
 from . import test_xapidb_filter
@@ -78,6 +81,61 @@ def test_no_root_privileges(bugtool, caplog, mocker):
     assert message == "Error: xen-bugtool must be run as root"
 
 
+def test_capabilities(bugtool, mocker, dom0_template, tmp_path, capsys):
+    """Assert that --capabilities prints the capabilities, including those of plugins"""
+
+    patch_bugtool(bugtool, mocker, dom0_template, "capabilities", tmp_path)
+    crash = tmp_path / "crash"
+    crash.mkdir()
+    (crash / "crash.log").write_bytes(b"x" * 100)
+    mocker.patch.object(bugtool, "HOST_CRASHDUMPS_DIR", str(crash))
+    sys.argv[1:] = ["--capabilities"]
+
+    assert bugtool.main() == 0
+
+    capabilities = fromstring(capsys.readouterr().out.encode())
+    assert capabilities.tag == bugtool.CAP_XML_ROOT
+    elements = {el.get("key"): el.attrib for el in capabilities}
+    assert elements["mock"] == {
+        "key": "mock",
+        "pii": "yes",
+        "min-size": "-1",
+        "max-size": "16384",
+        "min-time": "-1",
+        "max-time": "60",
+        "content-type": "text/plain",
+        "default-checked": "yes",
+    }
+    assert elements[bugtool.CAP_HOST_CRASHDUMP_LOGS]["max-size"] == "100"
+    assert bugtool.CAP_PERSISTENT_STATS not in elements  # hidden
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="minidom sorts the attributes before 3.8")
+def test_print_capabilities_minidom(bugtool, mocker, capsys):
+    """Assert that --capabilities prints the same XML as minidom's toprettyxml() did"""
+
+    mocker.patch.object(bugtool, "caps", {})
+    mocker.patch.object(bugtool, "cap_sizes", {})
+    bugtool.cap('quoted "&<key>"', bugtool.PII_YES, max_size=100, mime='text/"x"&<y>')
+    bugtool.cap("unchecked", bugtool.PII_NO, min_time=5, max_time=10, checked=False)
+    bugtool.cap("hidden", hidden=True)
+    bugtool.print_capabilities()
+
+    document = getDOMImplementation().createDocument("ns", bugtool.CAP_XML_ROOT, None)
+    for c in list(bugtool.caps.values())[:2]:
+        el = document.createElement(bugtool.CAP_XML_ELEMENT)
+        el.setAttribute("key", c[bugtool.KEY])
+        el.setAttribute("pii", c[bugtool.PII])
+        el.setAttribute("min-size", str(c[bugtool.MIN_SIZE]))
+        el.setAttribute("max-size", str(c[bugtool.MAX_SIZE]))
+        el.setAttribute("min-time", str(c[bugtool.MIN_TIME]))
+        el.setAttribute("max-time", str(c[bugtool.MAX_TIME]))
+        el.setAttribute("content-type", c[bugtool.MIME])
+        el.setAttribute("default-checked", c[bugtool.CHECKED] and "yes" or "no")
+        document.getElementsByTagName(bugtool.CAP_XML_ROOT)[0].appendChild(el)
+    assert capsys.readouterr().out == document.toprettyxml() + "\n"
+
+
 def patch_bugtool(bugtool, mocker, dom0_template, report_name, tmp_path):
     """Patch a bugtool module with mocks and configurations to execute main()
 
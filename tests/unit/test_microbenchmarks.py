@@ -0,0 +1,203 @@
+"""tests/unit/test_microbenchmarks.py: Micro-benchmarks of the hot functions of xen-bugtool
+
+The micro-benchmarks are opt-in:
+
+    BUGTOOL_MICROBENCHMARK=small pytest -s tests/unit/test_microbenchmarks.py
+
+With BUGTOOL_MICROBENCHMARK=large, they also run with the largest inputs (like a
+xapi database of 1M rows). Each benchmark reports the best time per item (row,
+entry, file, line or MiB) in microseconds, so the results of the input sizes and
+Python versions can be compared. Regressions against the baselines for the running
+Python version in microbenchmark-baselines.json fail the benchmark. The report
+lists the baselines of the other Python versions for comparison.
+
+To store the results as new baselines, set BUGTOOL_MICROBENCHMARK_UPDATE=1.
+"""
+
+from __future__ import print_function
+
+import io
+import json
+import os
+import re
+import sys
+import timeit
+
+import pytest
+
+MICROBENCHMARK = os.environ.get("BUGTOOL_MICROBENCHMARK")
+LARGE = MICROBENCHMARK == "large"
+BASELINES = os.path.join(os.path.dirname(__file__), "microbenchmark-baselines.json")
+PYTHON = "python%d.%d" % sys.version_info[:2]
+# Factor by which a result may exceed its baseline before the benchmark fails:
+TOLERANCE = 1.5
+REPEAT = 3
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    """Provide the baselines, store the updated baselines after the benchmarks"""
+    with open(BASELINES) as baselines_file:
+        stored = json.load(baselines_file)
+    yield stored
+    if MICROBENCHMARK and os.environ.get("BUGTOOL_MICROBENCHMARK_UPDATE"):
+        with open(BASELINES, "w") as baselines_file:
+            json.dump(stored, baselines_file, indent=4, sort_keys=True)
+            baselines_file.write("\n")
+
+
+@pytest.fixture(scope="function")
+def benchmark(request, bugtool, baselines, mocker):
+    """Provide a function to benchmark a function with inputs of the given number of items
+
+    The function is called REPEAT times, the best time is compared to the baseline.
+    """
+    if not MICROBENCHMARK:
+        pytest.skip("Set BUGTOOL_MICROBENCHMARK=<small|large> to run the micro-benchmarks")
+    mocker.patch.object(bugtool.ProcOutput, "debug", False)
+
+    def run(func, items, unit):
+        best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+        result = best * 1000000.0 / items
+        name = request.node.name
+        others = ", ".join(
+            "%s: %.3f" % (python, results[name])
+            for python, results in sorted(baselines.items())
+            if python != PYTHON and name in results
+        )
+        print("\n%-45s %12.3f us/%s %s" % (name, result, unit, others and "(" + others + ")"))
+        if os.environ.get("BUGTOOL_MICROBENCHMARK_UPDATE"):
+            baselines.setdefault(PYTHON, {})[name] = round(result, 3)
+            return
+        baseline = baselines.get(PYTHON, {}).get(name)
+        if baseline is None:
+            pytest.skip("No baseline for %s on %s" % (name, PYTHON))
+        assert result <= TOLERANCE * baseline, "%s: %.3f > %.1f * %.3f us/%s" % (
+            name, result, TOLERANCE, baseline, unit)
+
+    return run
+
+
+def xapi_db(rows):
+    """Return a xapi database of VM rows with secrets to filter"""
+    row = (
+        '<row ref="OpaqueRef:%d" uuid="%08d" name__label="VM %d" power_state="Running" '
+        "other_config=\"(('vm_password'%%.'secret'))\" NVRAM=\"(('EFI-variables'%%.'data'))\"/>\n"
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<database><table name="VM">\n'
+        + "".join(row % (i, i, i) for i in range(rows))
+        + "</table></database>\n"
+    ).encode()
+
+
+@pytest.mark.parametrize("rows", [10000, 100000] + ([1000000] if LARGE else []))
+def test_dbfilter(bugtool, benchmark, rows):
+    """Benchmark filtering the xapi database as it arrives from xe pool-dump-database"""
+    db = xapi_db(rows)
+    chunks = [db[i : i + bugtool.PIPE_READ_SIZE] for i in range(0, len(db), bugtool.PIPE_READ_SIZE)]
+
+    def filter_db():
+        state = {}  # type: dict[str, object]
+        output = io.BytesIO()
+        for chunk in chunks + [b""]:
+            output.write(bugtool.filter_db_pii(chunk, state))
+        dbfilter = state["dbfilter"]
+        assert isinstance(dbfilter, bugtool.DBFilter) and not dbfilter.failed
+
+    benchmark(filter_db, rows, "row")
+
+
+@pytest.mark.parametrize("entries", [10000] + ([100000] if LARGE else []))
+def test_make_inventory(bugtool, benchmark, mocker, entries):
+    """Benchmark creating the inventory.xml of a report"""
+    mocker.patch.object(bugtool, "getoutput", return_value="up 1 day")
+    inventory = {
+        "/var/log/file%d" % i: {"cap": "xenserver-logs", "filename": "/var/log/file%d" % i, "md5": "0" * 32}
+        for i in range(entries)
+    }
+    benchmark(lambda: bugtool.make_inventory(inventory, "bug-report"), entries, "entry")
+
+
+def test_construct_filename(bugtool, benchmark):
+    """Benchmark constructing the filenames in the archive of files and command outputs"""
+    entries = [("/var/log/file%d" % i, {"filename": "/var/log/file%d" % i}) for i in range(50000)]
+    entries += [("xl list --long %d" % i, {}) for i in range(50000)]
+
+    def construct_filenames():
+        for key, value in entries:
+            bugtool.construct_filename("bug-report", key, value)
+
+    benchmark(construct_filenames, len(entries), "entry")
+
+
+def create_tree(path, depth, width, files):
+    """Create a tree of depth levels with width subdirectories and files files in each"""
+    os.mkdir(path)
+    for i in range(files):
+        open(os.path.join(path, "file%d.conf" % i), "w").close()
+    if depth:
+        for i in range(width):
+            create_tree(os.path.join(path, "dir%d" % i), depth - 1, width, files)
+    return (width ** (depth + 1) - 1) // (width - 1) * files if width > 1 else (depth + 1) * files
+
+
+@pytest.mark.parametrize(
+    "depth, width, files",
+    [(0, 1, 20000), (100, 1, 100), (4, 6, 10)] + ([(0, 1, 200000), (5, 8, 10)] if LARGE else []),
+)
+def test_lookup_tree_recursively(bugtool, benchmark, mocker, tmp_path, depth, width, files):
+    """Benchmark finding the files to collect in wide and deep directory trees"""
+    root = str(tmp_path / "tree")
+    total = create_tree(root, depth, width, files)
+    mocker.patch.object(bugtool, "entries", [bugtool.CAP_XENSERVER_CONFIG])
+    specs = {root: [(bugtool.CAP_XENSERVER_CONFIG, re.compile(r".*\.conf$"), False, None)]}
+
+    def lookup():
+        bugtool.data = {}
+        bugtool.traverse_directory_specifications(specs, [bugtool.CAP_XENSERVER_CONFIG])
+        assert len(bugtool.data) == total
+
+    benchmark(lookup, total, "file")
+
+
+@pytest.mark.parametrize("procs, lines", [(16, 20000), (64, 5000)] + ([(256, 20000)] if LARGE else []))
+def test_run_proc_group(bugtool, benchmark, procs, lines):
+    """Benchmark reading the output of many processes, filtered by a line filter"""
+    command = "/usr/bin/yes /local/domain/1/data/set_clipboard = secret | /usr/bin/head -n %d" % lines
+
+    def run_proc_group():
+        outputs = [io.BytesIO() for _ in range(procs)]
+        bugtool.run_proc_group(
+            [bugtool.ProcOutput(command, 60, output, bugtool.filter_xenstore_secrets) for output in outputs]
+        )
+        assert all(output.getvalue().count(b"\n") == lines for output in outputs)
+
+    benchmark(run_proc_group, procs * lines, "line")
+
+
+def test_filter_xenstore_secrets(bugtool, benchmark):
+    """Benchmark filtering the clipboards of the domains from the output of xenstore-ls"""
+    lines = [
+        b"/local/domain/%d/data/set_clipboard = secret\n" % i
+        if i % 10 == 0
+        else b'/local/domain/%d/device/vif/0/state = "4"\n' % i
+        for i in range(1000000 if LARGE else 100000)
+    ]
+
+    def filter_lines():
+        state = {}  # type: dict[str, object]
+        for line in lines:
+            bugtool.filter_xenstore_secrets(line, state)
+
+    benchmark(filter_lines, len(lines), "line")
+
+
+@pytest.mark.parametrize("mb", [16] + ([256] if LARGE else []))
+def test_md5sum_file(bugtool, benchmark, tmp_path, mb):
+    """Benchmark the md5sums of files for the inventory"""
+    path = tmp_path / "file"
+    with open(str(path), "wb") as f:
+        for _ in range(mb):
+            f.write(os.urandom(1024 * 1024))
+    benchmark(lambda: bugtool.md5sum_file(str(path)), mb, "MiB")
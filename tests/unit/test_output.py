@@ -1,14 +1,23 @@
 """Unit tests for bugtool core functions creating minimal output archives"""
 
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
 import os
+import shutil
+import subprocess
+import sys
 import tarfile
 import zipfile
 
+import pytest
 from lxml.etree import XMLSchema, parse  # pytype: disable=import-error
 
 MOCK_EXCEPTION_STRINGS = (
     "Traceback (most recent call last):",
-    ", in collect_data",
+    ", in call_func",
     ", in mock_data_collector",
     'raise Exception("mock data collector failed")',
     "Exception: mock data collector failed",
@@ -85,6 +94,8 @@ def minimal_bugtool(bugtool, dom0_template, archive, subdir, mocker):
     """Load the plugins from the template and include the generated inventory"""
 
     mocker.patch("bugtool.time.strftime", return_value="time.strftime")
+    # Start with an empty size account for the mock capability in each test:
+    mocker.patch.dict(bugtool.cap_sizes, {"mock": 0})
     # Load the mock plugin from dom0_template and process the plugin's caps:
     bugtool.PLUGIN_DIR = dom0_template + "/etc/xensource/bugtool"
     bugtool.entries = ["mock"]
@@ -175,3 +186,186 @@ def test_zip_output(bugtool, tmp_path, dom0_template, mocker, capfd):
     with zipfile.ZipFile(tmp + "/zipfile.zip") as zip:
         zip.extractall(tmp)
         assert_mock_bugtool_plugin_output(tmp, subdir, zip.namelist())
+
+
+@pytest.mark.parametrize("output_type", ["tar.bz2", "tar.gz", "tar.xz", "tar.zst"])
+def test_compressed_tar_output(bugtool, tmp_path, dom0_template, mocker, capfd, output_type):
+    """Assert that compressed tarballs of many parallel compressed blocks are valid"""
+
+    if output_type == "tar.zst":
+        # The bugtool fixture sets PATH to the dom0 template, find zstd in the system:
+        zstd = shutil.which("zstd", path=os.path.dirname(sys.executable) + os.pathsep + os.defpath)
+        if not zstd:
+            pytest.skip("zstd is not installed")  # pragma: no cover
+        mocker.patch.object(bugtool, "ZSTD", zstd)
+    bugtool.BUG_DIR = tmp_path
+    # Compress the archive in many small blocks using two compression threads:
+    mocker.patch.object(bugtool, "max_parallel_procs", 2)
+    mocker.patch.dict(bugtool.BlockCompressor.block_sizes, {"bz2": 100, "gz": 100, "xz": 100})
+    archive = bugtool.TarOutput("tarball", output_type, -1, 1)
+    subdir = "tar_dir"
+
+    minimal_bugtool(bugtool, dom0_template, archive, subdir, mocker)
+
+    with capfd.disabled():
+        assert_minimal_bugtool(bugtool, archive, dom0_template, capfd)
+
+    tmp = tmp_path.as_posix()
+    tarball = tmp + "/tarball." + output_type
+    if output_type == "tar.zst":
+        subprocess.check_call([bugtool.ZSTD, "-q", "-d", "--rm", tarball])
+        tarball = tmp + "/tarball.tar"
+    with tarfile.open(tarball) as tar:
+        tar.extractall(tmp)
+        assert_mock_bugtool_plugin_output(tmp, subdir, tar.getnames())
+
+
+def test_block_compressor(bugtool, mocker):
+    """Assert that the concatenated compressed blocks decompress to the written data"""
+
+    data = b"".join(b"line %d\n" % i for i in range(10000))
+    mocker.patch.object(bugtool, "max_memory", 64 * 1024)
+    for comptype, decompress in (("bz2", bz2.decompress), ("xz", lzma.decompress)):
+        output = io.BytesIO()
+        compressor = bugtool.BlockCompressor(output, comptype, 1, 4)
+        compressor.block_size = 1000
+        for i in range(0, len(data), 777):
+            compressor.write(data[i : i + 777])
+        compressor.close()
+        assert decompress(output.getvalue()) == data
+    output = io.BytesIO()
+    compressor = bugtool.BlockCompressor(output, "gz", 1, 1)
+    compressor.write(data)
+    compressor.close()
+    assert gzip.decompress(output.getvalue()) == data
+
+
+@pytest.mark.parametrize("output_type", ["tar", "zip"])
+def test_inventory_md5sums(bugtool, tmp_path, dom0_template, mocker, output_type):
+    """Assert that the md5sums of files are computed while adding them to the archive"""
+
+    bugtool.BUG_DIR = tmp_path
+    mocker.patch.object(bugtool, "md5sum_file", side_effect=AssertionError("file read twice"))
+    if output_type == "zip":
+        archive = bugtool.ZipOutput("archive")
+    else:
+        archive = bugtool.TarOutput("archive", output_type, -1)
+    subdir = "md5_dir"
+    minimal_bugtool(bugtool, dom0_template, archive, subdir, mocker)
+
+    tmp = tmp_path.as_posix()
+    shutil.unpack_archive(archive.filename, tmp)
+    md5sums = {
+        el.get("filename"): el.get("md5sum")
+        for el in parse(tmp + "/" + subdir + "/inventory.xml").iter("inventory-entry")
+    }
+    for name in ("etc/group", "etc/passwd.tar"):
+        with open(tmp + "/" + subdir + "/" + name, "rb") as archived:
+            if name.endswith(".tar"):
+                # The inventory lists the md5sum of the file in the subarchive:
+                with tarfile.open(fileobj=archived) as tar:
+                    member = tar.extractfile(subdir + ETC_PASSWD)
+                    assert member
+                    content = member.read()
+                name = subdir + ETC_PASSWD
+            else:
+                content = archived.read()
+                name = subdir + "/" + name
+        assert md5sums[name] == hashlib.md5(content).hexdigest()
+
+
+def test_inventory_metadata(bugtool, tmp_path, dom0_template, mocker):
+    """Assert that the inventory records the size, duration, status and truncation of entries"""
+
+    bugtool.BUG_DIR = tmp_path
+    archive = bugtool.TarOutput("archive", "tar", -1)
+    subdir = "inventory_dir"
+    minimal_bugtool(bugtool, dom0_template, archive, subdir, mocker)
+
+    with tarfile.open(archive.filename) as tar:
+        inventory = parse(tar.extractfile(subdir + "/inventory.xml"))
+        sizes = {member.name: member.size for member in tar.getmembers()}
+    assert_valid_inventory_schema(inventory)
+    entries = {el.get("filename"): el for el in inventory.iter("inventory-entry")}
+    command = entries[subdir + "/ls-l-%etc.out"]
+    assert command.get("status") == "0"
+    assert command.get("size") == str(sizes[subdir + "/ls-l-%etc.out"])
+    assert float(command.get("duration")) >= 0
+    assert "truncated" not in command.attrib
+    function = entries[subdir + "/function_output.out"]
+    assert "status" not in function.attrib
+    assert float(function.get("duration")) >= 0
+
+    # Entries of commands which timed out or outputs cut at the size limit are truncated:
+    writer = bugtool.InventoryWriter()
+    writer.add("report/timeout.out", {"cap": "mock", "md5": "0" * 32, "status": 15, "truncated": True})
+    writer.add("report/not-archived.out", {"cap": "mock"})
+    inventory = parse(io.BytesIO(writer.close().getvalue()))
+    assert_valid_inventory_schema(inventory)
+    (entry,) = inventory.iter("inventory-entry")
+    assert entry.get("filename") == "report/timeout.out"
+    assert entry.get("truncated") == "true"
+
+
+def test_compressed_files_are_stored(bugtool, tmp_path, mocker):
+    """Assert that already compressed files are stored without compressing them again"""
+
+    bugtool.BUG_DIR = tmp_path
+    rotated_log = tmp_path / "xensource.log.1.gz"
+    rotated_log.write_bytes(gzip.compress(os.urandom(64 * 1024)))
+    compressed_data = tmp_path / "compressed.data"
+    compressed_data.write_bytes(bz2.compress(b"bz2 with an unknown suffix"))
+    text = tmp_path / "xensource.log"
+    text.write_bytes(b"log line\n" * 1000)
+    files = [rotated_log, compressed_data, text]
+
+    archive = bugtool.ZipOutput("zipfile")
+    for path in files:
+        assert archive.addRealFile(path.name, str(path)) == hashlib.md5(path.read_bytes()).hexdigest()
+    archive.close()
+    with zipfile.ZipFile(archive.filename) as zip_file:
+        compress_types = [zip_file.getinfo(path.name).compress_type for path in files]
+    assert compress_types == [zipfile.ZIP_STORED, zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+    os.unlink(archive.filename)
+
+    archive = bugtool.TarOutput("tarball", "tar.gz", -1)
+    set_stored = mocker.spy(archive.compressor, "set_stored")
+    for path in files:
+        assert archive.addRealFile(path.name, str(path)) == hashlib.md5(path.read_bytes()).hexdigest()
+    archive.close()
+    assert set_stored.call_args_list == [mocker.call(True), mocker.call(False)] * 2
+    with tarfile.open(archive.filename) as tar:
+        for path in files:
+            member = tar.extractfile(path.name)
+            assert member
+            assert member.read() == path.read_bytes()
+
+
+@pytest.mark.parametrize("comptype, decompress", [("gz", gzip.decompress), ("xz", lzma.decompress)])
+def test_block_compressor_stored(bugtool, comptype, decompress):
+    """Assert that stored gzip and xz blocks are not compressed and the stream stays valid"""
+
+    output = io.BytesIO()
+    compressor = bugtool.BlockCompressor(output, comptype, 9, 1)
+    compressor.write(b"compressible\n" * 1000)
+    compressor.set_stored(True)
+    compressor.write(b"stored\n" * 20000)
+    compressor.set_stored(False)
+    compressor.set_stored(True)  # An empty stored block
+    compressor.set_stored(False)
+    compressor.close()
+    assert decompress(output.getvalue()) == b"compressible\n" * 1000 + b"stored\n" * 20000
+    assert len(output.getvalue()) > len(b"stored\n" * 20000)
+
+
+def test_xz_stored_stream(bugtool):
+    """Assert that the xz streams of uncompressed LZMA2 chunks are valid for lzma and xz"""
+
+    for size in (0, 1, 64 * 1024, 64 * 1024 + 3, 900 * 1024):
+        block = os.urandom(size)
+        stream = bugtool.xz_stored_stream(block)
+        assert lzma.decompress(stream) == block
+        assert len(stream) < size + 3 * (size // (64 * 1024) + 1) + 64
+        xz = shutil.which("xz", path=os.path.dirname(sys.executable) + os.pathsep + os.defpath)
+        if xz:
+            assert subprocess.check_output([xz, "-dc"], input=stream) == block
@@ -0,0 +1,189 @@
+"""tests/unit/test_ovs_jsonrpc.py: Test the OVS outputs using JSON-RPC over the unix sockets of OVS"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+BRIDGES = {"xenbr0": ["bond0", "xenbr0"], "xapi1": []}
+BOND_LIST = "bond\ttype\trecirc-id\tslaves\nbond0\tactive-backup\t0\teth1, eth0\n"
+
+
+def fake_ovs_server(path, requests, release=None):
+    """Listen at path and answer the requests of connections like ovsdb-server and ovs-vswitchd
+
+    The reply to dpif/dump-flows is sent when the release event is set.
+    """
+
+    def reply(request):
+        requests.append(request)
+        method, params = request["method"], request["params"]
+        if method == "transact":
+            rows = [{"name": name} for name in BRIDGES]
+            return None, [{"rows": rows}, {"rows": [{"name": "xapi2"}]}]
+        if method == "bond/list":
+            return None, BOND_LIST
+        if method == "dpctl/dump-dps":
+            return None, "system@ovs-system\n"
+        if method == "fdb/show" and params == ["xenbr0"]:
+            return None, " port  VLAN  MAC                Age\n"
+        if method == "dpif/dump-flows" and release:
+            release.wait(10)
+            return None, "flows\n"
+        return "\"%s\" is not a valid command" % method, None
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(4)
+
+    def serve(connection):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        # Send an inactivity probe to check that the client answers it:
+        connection.sendall(json.dumps({"method": "echo", "params": [], "id": "echo"}).encode())
+        while True:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            buffer += chunk.decode()
+            while buffer:
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except ValueError:
+                    break
+                buffer = buffer[end:]
+                if request.get("id") == "echo":
+                    continue
+                error, result = reply(request)
+                # Send the replies in two parts to check that the client reassembles them:
+                message = json.dumps({"error": error, "result": result, "id": request["id"]}).encode()
+                connection.sendall(message[:10])
+                connection.sendall(message[10:])
+        connection.close()
+
+    def accept():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return  # The server was shut down by stop_ovs_servers()
+            thread = threading.Thread(target=serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_ovs_servers(bugtool, servers):
+    """Close the connections of bugtool and the fake servers"""
+    for connection in bugtool.ovs_connections.values():
+        connection.close()
+    for server in servers:
+        server.shutdown(socket.SHUT_RDWR)
+        server.close()
+
+
+@pytest.fixture(scope="function")
+def ovs(bugtool, mocker, tmp_path):
+    """Provide the fake ovsdb-server and ovs-vswitchd sockets and the requests they received"""
+    requests = {"db": [], "vswitchd": []}  # type: dict[str, list[dict[str, object]]]
+    pidfile = tmp_path / "ovs-vswitchd.pid"
+    pidfile.write_text("42\n")
+    mocker.patch.object(bugtool, "OPENVSWITCH_VSWITCHD_PID", str(pidfile))
+    mocker.patch.object(bugtool, "OPENVSWITCH_DB_SOCK", str(tmp_path / "db.sock"))
+    mocker.patch.object(bugtool, "ovs_connections", {})
+    servers = [
+        fake_ovs_server(str(tmp_path / "db.sock"), requests["db"]),
+        fake_ovs_server(str(tmp_path / "ovs-vswitchd.42.ctl"), requests["vswitchd"]),
+    ]
+    yield requests
+    stop_ovs_servers(bugtool, servers)
+
+
+def test_ovs_jsonrpc(bugtool, ovs):
+    """Assert the ovs-appctl outputs and the OVS lists from the JSON-RPC connections"""
+
+    assert bugtool.br_list() == ["xapi1", "xapi2", "xenbr0"]
+    assert bugtool.bond_list() == ["bond0"]
+    assert bugtool.dp_list() == ["system@ovs-system"]
+    fdb_show = bugtool.OvsAppctlOutput(["fdb/show", "xenbr0"])
+    assert fdb_show(bugtool.CAP_NETWORK_STATUS) == b" port  VLAN  MAC                Age\n"
+    assert bugtool.OvsAppctlOutput(["fdb/show", "xapi9"])(bugtool.CAP_NETWORK_STATUS) == b""
+
+    # All requests of the thread to each daemon used a single connection:
+    assert len(bugtool.ovs_connections) == 2
+    assert len(ovs["db"]) == 1 and len(ovs["vswitchd"]) == 4
+    assert ovs["db"][0]["params"][0] == "Open_vSwitch"
+    assert [request["method"] for request in ovs["vswitchd"]] == [
+        "bond/list", "dpctl/dump-dps", "fdb/show", "fdb/show",
+    ]
+
+
+def test_ovs_appctl_fallback(bugtool, mocker, tmp_path):
+    """Assert that ovs-appctl is run when ovs-vswitchd cannot be reached over its socket"""
+
+    mocker.patch.object(bugtool, "OPENVSWITCH_VSWITCHD_PID", str(tmp_path / "ovs-vswitchd.pid"))
+    mocker.patch.object(bugtool, "ovs_connections", {})
+    mocker.patch.object(bugtool, "log")
+    ovs_appctl = tmp_path / "ovs-appctl"
+    ovs_appctl.write_text('#!/bin/sh\necho "ovs-appctl $*"\n')
+    os.chmod(str(ovs_appctl), 0o755)  # nosec
+    mocker.patch.object(bugtool, "OVS_APPCTL", str(ovs_appctl))
+
+    assert bugtool.OvsAppctlOutput(["memory/show"])(bugtool.CAP_NETWORK_STATUS) == b"ovs-appctl memory/show\n"
+    (tmp_path / "ovs-vswitchd.pid").write_text("42\n")
+    assert bugtool.OvsAppctlOutput(["bond/show", "bond0"])(bugtool.CAP_NETWORK_STATUS) == (
+        b"ovs-appctl bond/show bond0\n"
+    )
+    assert not bugtool.ovs_connections
+
+
+def test_ovs_appctl_connections(bugtool, mocker, tmp_path):
+    """Assert that the requests of a thread do not wait for a slow request of another thread"""
+
+    pidfile = tmp_path / "ovs-vswitchd.pid"
+    pidfile.write_text("42\n")
+    mocker.patch.object(bugtool, "OPENVSWITCH_VSWITCHD_PID", str(pidfile))
+    mocker.patch.object(bugtool, "ovs_connections", {})
+    requests = []  # type: list[dict[str, object]]
+    release = threading.Event()
+    server = fake_ovs_server(str(tmp_path / "ovs-vswitchd.42.ctl"), requests, release)
+    outputs = []
+    slow = threading.Thread(target=lambda: outputs.append(bugtool.ovs_appctl("dpif/dump-flows", "xenbr0")))
+    slow.start()
+    while not requests:
+        time.sleep(0.01)
+
+    # The request of the main thread is answered while dpif/dump-flows is still pending:
+    assert bugtool.ovs_appctl("dpctl/dump-dps") == "system@ovs-system\n"
+    assert slow.is_alive()
+    release.set()
+    slow.join(5)
+    assert outputs == ["flows\n"]
+    assert len(bugtool.ovs_connections) == 2
+    stop_ovs_servers(bugtool, [server])
+
+
+def test_ovs_appctl_output_size(bugtool, ovs, mocker):
+    """Assert that like the output of ovs-appctl, the outputs are not counted in the cap size"""
+
+    cap = bugtool.CAP_NETWORK_STATUS
+    max_size = bugtool.caps[cap][bugtool.MAX_SIZE]
+    mocker.patch.object(bugtool, "unlimited_data", False)
+    mocker.patch.object(bugtool, "entries", [cap])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.dict(bugtool.cap_sizes, {cap: max_size})  # Filled by other func_output() entries
+    bugtool.ovs_appctl_output("bond/list")
+
+    archive = mocker.Mock()
+    bugtool.collect_data("report", archive)
+    assert archive.add_path_with_data.call_count == 1
+    assert bugtool.data["ovs-appctl bond/list"]["size"] == len(BOND_LIST)
+    assert bugtool.cap_sizes[cap] == max_size
+    assert [request["method"] for request in ovs["vswitchd"]] == ["bond/list"]
@@ -1,5 +1,8 @@
 """Regression tests for the bugtool helper function mdadm_arrays()"""
 
+import lzma
+import struct
+
 
 def test_mdadm_arrays(bugtool, dom0_template):
     """Assert mdadm_arrays() returning arrays dom0_template/usr/sbin/mdadm"""
@@ -32,8 +35,226 @@ vermagic:       6.6.22+0 SMP mod_unload modversions
     assert bugtool.module_info(bugtool.CAP_KERNEL_INFO) == expected
 
 
+def der(tag, *values):
+    """Return the DER encoding of the tag and the concatenated values"""
+    value = b"".join(values)
+    if len(value) < 0x80:
+        return bytes([tag, len(value)]) + value
+    length = len(value).to_bytes(2, "big")
+    return bytes([tag, 0x80 | len(length)]) + length + value
+
+
+def module_signature():
+    """Return a PKCS#7 module signature like the one appended by the sign-file of the kernel"""
+    issuer = der(
+        0x30,
+        der(0x31, der(0x30, der(0x06, b"\x55\x04\x0a"), der(0x0c, b"XenServer"))),
+        der(0x31, der(0x30, der(0x06, b"\x55\x04\x03"), der(0x0c, b"Build time autogenerated kernel key"))),
+    )
+    sha256 = der(0x30, der(0x06, b"\x60\x86\x48\x01\x65\x03\x04\x02\x01"), der(0x05))
+    signer_info = der(
+        0x30,
+        der(0x02, b"\x01"),
+        der(0x30, issuer, der(0x02, b"\x00\x9a\x3c")),
+        sha256,
+        der(0x30, der(0x06, b"\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01"), der(0x05)),
+        der(0x04, bytes(range(25))),
+    )
+    signed_data = der(
+        0x30,
+        der(0x02, b"\x01"),
+        der(0x31, sha256),
+        der(0x30, der(0x06, b"\x2a\x86\x48\x86\xf7\x0d\x01\x07\x01")),
+        der(0x31, signer_info),
+    )
+    pkcs7 = der(0x30, der(0x06, b"\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02"), der(0xA0, signed_data))
+    return pkcs7 + struct.pack(">BBBBB3xI", 0, 0, 2, 0, 0, len(pkcs7)) + b"~Module signature appended~\n"
+
+
+def elf_module(modinfo, signed=False):
+    """Return a minimal 64-bit ELF file with a .modinfo section, optionally signed"""
+    shstrtab = b"\0.modinfo\0.shstrtab\0"
+    shoff = 64 + len(modinfo) + len(shstrtab)
+    header = b"\x7fELF\x02\x01\x01" + b"\0" * 9
+    header += struct.pack("<HHIQQQIHHHHHH", 1, 62, 1, 0, 0, shoff, 0, 64, 0, 0, 64, 3, 2)
+    sections = struct.pack("<IIQQQQIIQQ", 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    sections += struct.pack("<IIQQQQIIQQ", 1, 1, 0, 0, 64, len(modinfo), 0, 0, 1, 0)
+    sections += struct.pack("<IIQQQQIIQQ", 10, 3, 0, 0, 64 + len(modinfo), len(shstrtab), 0, 0, 1, 0)
+    signature = module_signature() if signed else b""
+    return header + modinfo + shstrtab + sections + signature
+
+
+def test_module_info_elf(bugtool, dom0_template, mocker, tmp_path):
+    """Assert module_info() reading the .modinfo sections and running modinfo for the rest"""
+
+    mocker.patch.object(bugtool, "MODULES_DIR", str(tmp_path))
+    mocker.patch.object(bugtool, "MODINFO", dom0_template + "/usr/sbin/modinfo")
+    mocker.patch.object(bugtool, "max_parallel_procs", 1)
+    modules = tmp_path / "modules"
+    modules.write_text(
+        "compressed 1 0 - Live\ndell_smbios 2 0 - Live\nfoo_bar 3 0 - Live\nsigned 4 0 - Live\n"
+    )
+    mocker.patch.object(bugtool, "PROC_MODULES", str(modules))
+    (tmp_path / "modules.dep").write_text(
+        "kernel/foo-bar.ko:\nkernel/compressed.ko.xz: kernel/foo-bar.ko\nkernel/signed.ko:\n"
+    )
+    (tmp_path / "kernel").mkdir()
+    (tmp_path / "kernel/foo-bar.ko").write_bytes(
+        elf_module(
+            b"parmtype=debug:int\0parm=debug:Enable debug\0license=GPL\0\0\0"
+            b"parmtype=quiet:bool\0a_very_long_key_x=1\0name=foo_bar\0"
+        )
+    )
+    (tmp_path / "kernel/compressed.ko.xz").write_bytes(lzma.compress(elf_module(b"name=compressed\0")))
+    signed_module = elf_module(b"parmtype=debug:int\0name=signed\0", signed=True)
+    (tmp_path / "kernel/signed.ko").write_bytes(signed_module)
+
+    output = bugtool.module_info(bugtool.CAP_KERNEL_INFO)
+    compressed, dell_smbios, foo_bar, signed = output.split(b"filename:       ")[1:]
+    assert compressed == (
+        str(tmp_path / "kernel/compressed.ko.xz").encode() + b"\nname:           compressed\n"
+    )
+    assert dell_smbios.startswith(b"/lib/modules/6.6.22+0/kernel/drivers/platform/x86/dell/dell-smbios.ko")
+    assert foo_bar == str(tmp_path / "kernel/foo-bar.ko").encode() + b"""
+license:        GPL
+a_very_long_key_x:  1
+name:           foo_bar
+parm:           debug:Enable debug (int)
+parm:           quiet (bool)
+"""
+    # The signature lines of modinfo precede the parameters:
+    assert signed == str(tmp_path / "kernel/signed.ko").encode() + b"""
+name:           signed
+sig_id:         PKCS#7
+signer:         Build time autogenerated kernel key
+sig_key:        9A:3C
+sig_hashalgo:   sha256
+signature:      00:01:02:03:04:05:06:07:08:09:0A:0B:0C:0D:0E:0F:10:11:12:13:
+\t\t14:15:16:17:18
+parm:           debug (int)
+"""
+
+
+def test_module_signature_invalid(bugtool):
+    """Assert that modules with signatures which cannot be decoded are left to modinfo"""
+
+    module = elf_module(b"name=signed\0")
+    magic = b"~Module signature appended~\n"
+    pkcs7 = module_signature()[: -len(magic) - 12]
+    assert bugtool.module_signature(module + module_signature())
+    # A truncated PKCS#7 signature and one with SEQUENCE instead of SET tags:
+    for sig in (pkcs7[:-10], pkcs7.replace(b"\x31", b"\x30")):
+        trailer = struct.pack(">BBBBB3xI", 0, 0, 2, 0, 0, len(sig)) + magic
+        assert bugtool.module_signature(module + sig + trailer) is None
+
+
+def test_module_info_modinfo_missing(bugtool, dom0_template, mocker, tmp_path):
+    """Assert module_info() skipping the modules which the batched modinfo does not output"""
+
+    mocker.patch.object(bugtool, "MODULES_DIR", str(tmp_path))
+    mocker.patch.object(bugtool, "MODINFO", dom0_template + "/usr/sbin/modinfo")
+    mocker.patch.object(bugtool, "max_parallel_procs", 1)
+    modules = tmp_path / "modules"
+    modules.write_text("dell_smbios 2 0 - Live\nunknown 1 0 - Live\nfrom_file 3 0 - Live\n")
+    mocker.patch.object(bugtool, "PROC_MODULES", str(modules))
+    (tmp_path / "modules.dep").write_text("kernel/from_file.ko:\n")
+    (tmp_path / "kernel").mkdir()
+    (tmp_path / "kernel/from_file.ko").write_bytes(elf_module(b"name=from_file\0"))
+    run_procs = mocker.spy(bugtool, "run_procs")
+
+    output = bugtool.module_info(bugtool.CAP_KERNEL_INFO)
+    # One modinfo for the modules not read from their files, it fails to find "unknown":
+    assert [p.command for p in run_procs.call_args[0][0][0]] == [
+        [dom0_template + "/usr/sbin/modinfo", "dell_smbios", "unknown"]
+    ]
+    dell_smbios, from_file = output.split(b"filename:       ")[1:]
+    assert dell_smbios.startswith(b"/lib/modules/6.6.22+0/kernel/drivers/platform/x86/dell/dell-smbios.ko")
+    assert dell_smbios.endswith(b"vermagic:       6.6.22+0 SMP mod_unload modversions\n")
+    assert from_file == str(tmp_path / "kernel/from_file.ko").encode() + b"\nname:           from_file\n"
+
+
 def test_multipathd_topology(bugtool, dom0_template):
     """Assert multipathd_topology() returning the output of the faked multipathd tool"""
 
     bugtool.MULTIPATHD = dom0_template + "/usr/sbin/multipathd"
     assert bugtool.multipathd_topology(bugtool.CAP_MULTIPATH) == "multipathd-k"
+
+
+def test_run_procs_parallel(bugtool, mocker):
+    """Assert run_procs() running the processes of a process group in parallel"""
+
+    output = bugtool.io.BytesIO()
+    procs = [
+        bugtool.ProcOutput("/bin/sleep 0.5; echo slow", 10, output),
+        bugtool.ProcOutput("echo fast", 10, output),
+    ]
+    mocker.patch.object(bugtool, "max_parallel_procs", 2)
+    bugtool.run_procs([procs])
+
+    # The 2nd process finished first as it was started without waiting for the 1st:
+    assert output.getvalue() == b"fast\nslow\n"
+    assert [p.status for p in procs] == [0, 0]
+
+
+def test_run_procs_group_limits(bugtool, mocker):
+    """Assert run_procs() running the processes of limited groups one by one"""
+
+    outputs = [bugtool.io.BytesIO(), bugtool.io.BytesIO()]
+    serial = [
+        bugtool.ProcOutput("/bin/sleep 0.5; echo slow", 10, outputs[0]),
+        bugtool.ProcOutput("echo fast", 10, outputs[0]),
+    ]
+    parallel = [bugtool.ProcOutput("echo other group", 10, outputs[1])]
+    mocker.patch.object(bugtool, "max_parallel_procs", 3)
+    bugtool.run_procs([serial, parallel], [1])
+
+    # The group limit of 1 runs the processes of the 1st group one after another:
+    assert outputs[0].getvalue() == b"slow\nfast\n"
+    assert outputs[1].getvalue() == b"other group\n"
+
+    # The global limit of 1 runs all processes one after another:
+    output = bugtool.io.BytesIO()
+    mocker.patch.object(bugtool, "max_parallel_procs", 1)
+    bugtool.run_proc_group(
+        [
+            bugtool.ProcOutput("/bin/sleep 0.5; echo slow", 10, output),
+            bugtool.ProcOutput("echo fast", 10, output),
+        ]
+    )
+    assert output.getvalue() == b"slow\nfast\n"
+
+
+def test_proc_output_filter_lines(bugtool):
+    """Assert that the filter of ProcOutput gets complete lines from the chunks"""
+
+    output = bugtool.io.BytesIO()
+    proc = bugtool.ProcOutput("true", 10, output, bugtool.filter_xenstore_secrets)
+
+    # Chunks of output, split in the middle of the lines:
+    for chunk in (b"/local/domain/1/data/set_", b"clipboard = secret\nfoo", b"\nbar"):
+        proc.write_output(chunk)
+    proc.flush_output()
+
+    filtered = b"/local/domain/1/data/set_clipboard = <filtered for security>\n"
+    assert output.getvalue() == filtered + b"foo\nbar"
+
+
+def test_proc_output_chunks(bugtool):
+    """Assert that ProcOutput reads large outputs in chunks without losing data"""
+
+    def no_filter(line, _):
+        """Filter that passes each line, used to check the line framing"""
+        assert line.endswith(b"\n") or line == b"last line"
+        return line
+
+    outputs = [bugtool.io.BytesIO(), bugtool.io.BytesIO()]
+    command = "/usr/bin/seq 1 100000; printf 'last line'"
+    procs = [
+        bugtool.ProcOutput(command, 60, outputs[0]),
+        bugtool.ProcOutput(command, 60, outputs[1], no_filter),
+    ]
+    bugtool.run_procs([procs])
+
+    expected = b"".join(b"%d\n" % n for n in range(1, 100001)) + b"last line"
+    assert outputs[0].getvalue() == expected
+    assert outputs[1].getvalue() == expected
@@ -0,0 +1,55 @@
+"""tests/unit/test_profile.py: Unit-Test the timeline of xen-bugtool --profile"""
+
+import json
+import tarfile
+
+
+def test_profile(bugtool, tmp_path, mocker):
+    """Assert that commands, funcs, files and compression are recorded in the profile"""
+
+    cap = bugtool.CAP_XENSERVER_LOGS
+    log = tmp_path / "SMlog"
+    log.write_bytes(b"log line\n" * 250000)  # Fills at least one compressed block
+    mocker.patch.object(bugtool, "entries", [cap])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.object(bugtool, "directory_specifications", {})
+    mocker.patch.dict(bugtool.cap_sizes, {cap: 0})
+    mocker.patch.object(bugtool, "profiler", bugtool.Profiler())
+    mocker.patch.object(bugtool, "BUG_DIR", str(tmp_path))
+
+    bugtool.cmd_output(cap, ["/bin/echo", "output"])
+    bugtool.cmd_output(cap, ["/bin/sh", "-c", "exit 3"], label="failing")
+    bugtool.func_output(cap, "func", lambda _: "func output")
+    bugtool.file_output(cap, [str(log)])
+    archive = bugtool.TarOutput("report", "tar.gz", -1)
+    bugtool.collect_data("report", archive)
+    bugtool.include_profile(archive, "report")
+    assert archive.close()
+
+    trace = json.loads(bugtool.profiler.trace())
+    events = {event["name"]: event for event in trace["traceEvents"]}
+    echo = events["report/echo-output.out"]
+    assert echo["cat"] == "command"
+    assert echo["args"]["cap"] == cap
+    assert echo["args"]["bytes_out"] == len(b"output\n")
+    assert echo["args"]["status"] == 0
+    assert echo["args"]["queue_wait"] >= 0
+    assert echo["args"]["cpu"] is not None
+    assert events["report/failing.out"]["args"]["status"] == 3
+    assert events["func"]["args"]["bytes_out"] == len(b"func output")
+    assert events[str(log)]["cat"] == "file"
+    assert events[str(log)]["args"]["bytes_in"] == len(b"log line\n" * 250000)
+    assert events["gz block"]["args"]["bytes_in"] > events["gz block"]["args"]["bytes_out"]
+
+    summary = bugtool.profiler.summary().splitlines()
+    assert summary[0].split()[0] == "capability"
+    totals = {line.split()[0]: line.split()[1:] for line in summary[1:]}
+    assert totals[cap][0] == "4"
+    assert int(totals["compress"][0]) >= 1
+
+    with tarfile.open(str(tmp_path / "report.tar.gz")) as tar:
+        profile_json = tar.extractfile("report/profile.json")
+        profile_txt = tar.extractfile("report/profile.txt")
+        assert profile_json and profile_txt
+        assert json.load(profile_json)["traceEvents"]
+        assert profile_txt.readline().startswith(b"capability")
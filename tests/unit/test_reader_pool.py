@@ -0,0 +1,65 @@
+"""tests/unit/test_reader_pool.py: Test reading the files of /proc, /sys and network mounts"""
+
+import threading
+
+
+def test_reader_pool_hung_mount(bugtool, mocker):
+    """Assert that the files of a hung mount time out without blocking the other mounts"""
+
+    mocker.patch.object(bugtool, "unlimited_time", False)
+    mocker.patch.object(bugtool, "mount_points", return_value=[("/mnt/nfs", "nfs"), ("/proc", "proc")])
+    mocker.patch.object(bugtool, "FILE_READ_TIME", 1)
+    release = threading.Event()
+    read_file = bugtool.read_file
+
+    def hanging_read_file(v):
+        if v["filename"].startswith("/mnt/nfs/"):
+            release.wait(10)
+        return read_file(v)
+
+    mocker.patch.object(bugtool, "read_file", hanging_read_file)
+    pool = bugtool.ReaderPool(1)
+    assert pool.reads({"filename": "/mnt/nfs/sr/metadata.db"})
+    assert pool.reads({"filename": "/sys/class/net/eth0/mtu"})
+    assert not pool.reads({"filename": "/var/log/messages"})
+    assert not pool.reads({"filename": "/mnt/nfs/log", "window": True})
+
+    entries = [{"cap": bugtool.CAP_KERNEL_INFO, "filename": f} for f in ("/mnt/nfs/a", "/mnt/nfs/b")]
+    entries.append({"cap": bugtool.CAP_KERNEL_INFO, "filename": "/proc/self/status"})
+    jobs = [pool.submit(v["filename"], v) for v in entries]
+    pool.start()
+
+    assert b"State:" in jobs[2].result().getvalue()
+    assert jobs[0].result().getvalue() == b"** timeout **\n"
+    # The queued file of the hung mount is not read, but times out immediately:
+    assert jobs[1].result().getvalue() == b"** timeout **\n"
+    assert jobs[1].duration() == 0
+    assert entries[0]["truncated"] and entries[1]["truncated"] and "truncated" not in entries[2]
+    release.set()
+
+
+def test_reader_pool_stuck_proc_file(bugtool, mocker):
+    """Assert that the other files of /proc are read when one read of /proc times out"""
+
+    mocker.patch.object(bugtool, "unlimited_time", False)
+    mocker.patch.object(bugtool, "mount_points", return_value=[("/proc", "proc")])
+    mocker.patch.object(bugtool, "FILE_READ_TIME", 1)
+    release = threading.Event()
+    read_file = bugtool.read_file
+
+    def hanging_read_file(v):
+        if v["filename"] == "/proc/self/stat":
+            release.wait(10)
+        return read_file(v)
+
+    mocker.patch.object(bugtool, "read_file", hanging_read_file)
+    pool = bugtool.ReaderPool(1)
+    entries = [{"cap": bugtool.CAP_KERNEL_INFO, "filename": f} for f in ("/proc/self/stat", "/proc/self/status")]
+    jobs = [pool.submit(v["filename"], v) for v in entries]
+    pool.start()
+
+    assert jobs[0].result().getvalue() == b"** timeout **\n"
+    # The thread of the stuck read is replaced, it reads the next file:
+    assert b"State:" in jobs[1].result().getvalue()
+    assert entries[0]["truncated"] and "truncated" not in entries[1]
+    release.set()
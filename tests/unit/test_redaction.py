@@ -0,0 +1,84 @@
+"""tests/unit/test_redaction.py: Unit-Test the streaming RedactionFilter of xen-bugtool"""
+
+import re
+
+
+def test_redaction_filter(bugtool, mocker):
+    """Assert that the rules are redacted in one pass over chunks split at any byte"""
+
+    redaction = bugtool.RedactionFilter(
+        [
+            (r"(password=)\S+", r"\1REMOVED"),
+            (r"^(\w+ \d+ sshd\[\d+\]: Accepted \w+ for )\S+", r"\1USER"),
+        ]
+    )
+    log = (
+        b"Mar 1 sshd[12]: Accepted publickey for alice from 10.0.0.1\n"
+        + b"login password=secret other password=secret2\n"
+        + b"no match\n"
+    ) * 3
+    expected = (
+        b"Mar 1 sshd[12]: Accepted publickey for USER from 10.0.0.1\n"
+        + b"login password=REMOVED other password=REMOVED\n"
+        + b"no match\n"
+    ) * 3
+    assert redaction.redact(log) == expected
+    for size in (1, 7, 64):
+        state = {}  # type: dict[str, bytes]
+        chunks = [log[i : i + size] for i in range(0, len(log), size)] + [b""]
+        assert b"".join(redaction(chunk, state) for chunk in chunks) == expected
+
+    # Lines longer than REDACTION_MAX_LINE are redacted in pieces:
+    mocker.patch.object(bugtool, "REDACTION_MAX_LINE", 8)
+    state = {}
+    assert redaction(b"password=1234567", state) == b"password=REMOVED"
+    assert redaction(b"", state) == b""
+
+
+def test_redaction_filter_separate_rules(bugtool):
+    """Assert that rules with backreferences and reused named groups keep their meaning"""
+
+    redaction = bugtool.RedactionFilter(
+        [
+            (r"(password=)\S+", r"\1REMOVED"),
+            (r"(['\"])secret\1", r"\1REMOVED\1"),
+            (r"(?P<key>token=)\w+", r"\g<key>REMOVED"),
+            (r"(?P<key>key=)\w+", r"\g<key>REMOVED"),
+            (r"(?i)pin=\d+", r"pin=REMOVED"),
+        ]
+    )
+    assert redaction.regex and redaction.separate == [1, 2, 3, 4]
+    assert redaction.redact(
+        b"password=x 'secret' \"secret' token=a KEY=b PIN=1\n"
+    ) == b"password=REMOVED 'REMOVED' \"secret' token=REMOVED KEY=b pin=REMOVED\n"
+
+
+def test_tree_output_filter(bugtool, fs, mocker):
+    """Assert that tree_output() entries with a filter are archived redacted"""
+
+    fs.create_file("/var/log/secure", contents="user password=secret\n")
+    fs.create_file("/var/log/messages", contents="password=kept\n")
+    mocker.patch.object(bugtool, "directory_specifications", bugtool.OrderedDict())
+    mocker.patch.object(bugtool, "entries", ["mock"])
+    mocker.patch.object(bugtool, "unlimited_data", True)  # no caps["mock"] size limit
+    mocker.patch.object(bugtool, "since_inventory", {})
+    mocker.patch.object(bugtool, "getoutput", return_value="up")  # uptime of the inventory
+    redaction = bugtool.RedactionFilter([(r"(password=)\S+", r"\1REMOVED")])
+    bugtool.tree_output("mock", "/var/log", re.compile(r".*/secure$"), False, redaction)
+    bugtool.tree_output("mock", "/var/log", re.compile(r".*/messages$"))
+
+    archive = mocker.Mock()
+    archived = {}
+    archive.add_path_with_data.side_effect = lambda name, output: archived.update(
+        {name: output.getvalue()}
+    )
+    archive.addRealFile.side_effect = lambda name, filename, *args: archived.update(
+        {name: open(filename, "rb").read()}
+    )
+    bugtool.collect_data("report", archive)
+
+    assert archived == {
+        "report/var/log/secure": b"user password=REMOVED\n",
+        "report/var/log/messages": b"password=kept\n",
+    }
+    assert bugtool.data["/var/log/secure"]["md5"]
@@ -0,0 +1,85 @@
+"""tests/unit/test_since.py: Unit-Test incremental reports using xen-bugtool --since"""
+
+import hashlib
+import os
+import shutil
+import tarfile
+import zipfile
+
+from lxml.etree import parse  # pytype: disable=import-error
+
+from .test_output import assert_valid_inventory_schema
+
+
+def collect_report(bugtool, archive, subdir, files):
+    """Collect the passed files into the archive with an inventory and close it"""
+
+    bugtool.data = {str(path): {"cap": "mock", "filename": str(path)} for path in files}
+    bugtool.collect_data(subdir, archive)
+    bugtool.include_inventory(archive, subdir)
+    assert archive.close()
+
+
+def test_since(bugtool, tmp_path, mocker):
+    """Assert that --since skips unchanged files and adds only the tail of grown files"""
+
+    mocker.patch.object(bugtool, "directory_specifications", {})
+    mocker.patch.object(bugtool, "entries", [])
+    mocker.patch.object(bugtool, "since_inventory", {})
+    bugtool.BUG_DIR = tmp_path
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    unchanged, grown, rewritten = logs / "unchanged.log", logs / "grown.log", logs / "rewritten.log"
+    unchanged.write_bytes(b"unchanged\n" * 100)
+    grown.write_bytes(b"first\n" * 100)
+    rewritten.write_bytes(b"before\n" * 100)
+    files = [unchanged, grown, rewritten]
+    collect_report(bugtool, bugtool.TarOutput("first", "tar.gz", -1), "first", files)
+
+    with grown.open("ab") as log:
+        log.write(b"second\n" * 10)
+    rewritten.write_bytes(b"after\n" * 100)
+
+    # Load the inventory of the first report and create the incremental report:
+    since_inventory = bugtool.load_since_inventory(str(tmp_path / "first.tar.gz"))
+    mocker.patch.object(bugtool, "since_inventory", since_inventory)
+    mocker.patch.object(bugtool, "since_file", "first.tar.gz")
+    collect_report(bugtool, bugtool.ZipOutput("second"), "second", files)
+
+    with zipfile.ZipFile(str(tmp_path / "second.zip")) as zip_file:
+        assert sorted(zip_file.namelist()) == sorted(
+            ["second" + str(grown), "second" + str(rewritten), "second/inventory.xml"]
+        )
+        assert zip_file.read("second" + str(grown)) == b"second\n" * 10
+        inventory = parse(zip_file.open("second/inventory.xml"))
+    assert_valid_inventory_schema(inventory)
+
+    entries = {el.get("filename"): el for el in inventory.iter("inventory-entry")}
+    grown_entry = entries["second" + str(grown)]
+    assert grown_entry.get("md5sum") == hashlib.md5(b"second\n" * 10).hexdigest()  # nosec
+    assert grown_entry.get("file-md5sum") == hashlib.md5(grown.read_bytes()).hexdigest()  # nosec
+    assert grown_entry.get("offset") == str(len(b"first\n" * 100))
+    assert grown_entry.get("size") == str(grown.stat().st_size)
+    assert "offset" not in entries["second" + str(rewritten)].attrib
+    assert "file-md5sum" not in entries["second" + str(rewritten)].attrib
+
+    (unchanged_entry,) = inventory.iter("unchanged-entry")
+    assert unchanged_entry.getparent().get("since") == "first.tar.gz"
+    assert unchanged_entry.get("filename") == "first" + str(unchanged)
+    assert unchanged_entry.get("md5sum") == hashlib.md5(unchanged.read_bytes()).hexdigest()  # nosec
+
+    # A report since the incremental report refers to the first report for unchanged files:
+    inventory = bugtool.load_since_inventory(str(tmp_path / "second.zip"))
+    assert inventory[str(unchanged)[1:]]["filename"] == "first" + str(unchanged)
+    assert inventory[str(grown)[1:]]["size"] == grown.stat().st_size
+    assert inventory[str(grown)[1:]]["md5"] == grown_entry.get("md5sum")
+    assert inventory[str(grown)[1:]]["file_md5"] == grown_entry.get("file-md5sum")
+
+    # The inventory can also be read from tarballs and passed as XML file:
+    with tarfile.open(str(tmp_path / "first.tar.gz")) as tar:
+        tar.extract("first/inventory.xml", str(tmp_path))
+    inventory = bugtool.load_since_inventory(str(tmp_path / "first/inventory.xml"))
+    assert inventory[str(grown)[1:]]["offset"] is None
+    shutil.rmtree(str(tmp_path / "first"))
+    for report in ("first.tar.gz", "second.zip"):
+        os.unlink(str(tmp_path / report))
@@ -48,3 +48,11 @@ def test_filter_snmpd_conf(bugtool, builtins, mocker):
     )
     mocker.patch(builtins + ".open", mocker.mock_open(read_data=snmpd_conf_input))
     assert bugtool.filter_snmpd_conf("_") == snmpd_conf_output
+
+
+def test_filter_snmpd_conf_multiline(bugtool, builtins, mocker):
+    """Assert that the SNMP filters redact the fields of entries continued on the next lines"""
+
+    snmpd_xs_conf_input = "com2sec notConfigUser\n    default SECRET\n"
+    mocker.patch(builtins + ".open", mocker.mock_open(read_data=snmpd_xs_conf_input))
+    assert bugtool.filter_snmpd_xs_conf("_") == "com2sec notConfigUser\n    default REMOVED\n"
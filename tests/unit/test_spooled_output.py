@@ -0,0 +1,72 @@
+"""tests/unit/test_spooled_output.py: Unit-Test bugtool.SpooledOutput"""
+
+import hashlib
+import tarfile
+import zipfile
+
+
+def test_spooled_output_spills_to_file(bugtool, mocker):
+    """Assert that SpooledOutput keeps only spool_size() bytes in memory"""
+
+    mocker.patch.object(bugtool, "max_memory", 1024)
+    mocker.patch.object(bugtool, "max_parallel_procs", 4)
+    output = bugtool.SpooledOutput()
+    assert bugtool.spool_size() == 256
+
+    output.write(b"x" * 200)
+    assert not output.file._rolled
+    output.write("y" * 200)
+    assert output.file._rolled
+
+    data = b"x" * 200 + b"y" * 200
+    assert output.size == len(data)
+    assert output.getvalue() == data
+    assert output.hexdigest() == hashlib.md5(data).hexdigest()  # nosec
+    assert bugtool.md5sum({"output": output}) == output.hexdigest()
+    assert not output.truncated
+    output.close()
+
+
+def test_spooled_output_truncates(bugtool):
+    """Assert that SpooledOutput drops the data beyond its max_size"""
+
+    output = bugtool.SpooledOutput(max_size=10)
+    output.write(b"0123456")
+    output.write(b"789abcdef")
+    output.write(b"more")
+
+    assert output.truncated
+    assert output.size == 10
+    assert output.getvalue() == b"0123456789"
+    assert output.hexdigest() == hashlib.md5(b"0123456789").hexdigest()  # nosec
+    output.close()
+
+
+def seek_returning_none(fileobj):
+    """Return the seek() of the file, returning None like SpooledTemporaryFile.seek() of Python 3.6"""
+    seek = fileobj.seek
+    return lambda *args: seek(*args) and None
+
+
+def test_spooled_output_add_path_with_data(bugtool, mocker, tmp_path):
+    """Assert that rolled-over SpooledOutputs are archived with their size on Python 3.6"""
+
+    mocker.patch.object(bugtool, "BUG_DIR", str(tmp_path))
+    mocker.patch.object(bugtool, "max_memory", 1024)
+    mocker.patch.object(bugtool, "max_parallel_procs", 4)
+    data = b"0123456789" * 100
+    for archive in (bugtool.TarOutput("tarball", "tar", -1), bugtool.ZipOutput("zipfile")):
+        output = bugtool.SpooledOutput()
+        output.write(data)
+        assert output.file._rolled
+        mocker.patch.object(output.file, "seek", seek_returning_none(output.file))
+        archive.add_path_with_data("output.out", output)
+        output.close()
+        assert archive.close()
+
+    with tarfile.open(str(tmp_path / "tarball.tar")) as tar:
+        archived = tar.extractfile("output.out")
+        assert archived
+        assert archived.read() == data
+    with zipfile.ZipFile(str(tmp_path / "zipfile.zip")) as zip_file:
+        assert zip_file.read("output.out") == data
@@ -0,0 +1,67 @@
+"""tests/unit/test_tree_output.py: Unit-Test tree_output() and the directory traversal"""
+
+import os
+import re
+
+
+def test_traverse_directory_specifications(bugtool, fs, mocker):
+    """Assert that each directory is walked once and all specs apply to its entries"""
+
+    for path in (
+        "/etc/sysconfig/network-scripts/ifcfg-eth0",
+        "/etc/sysconfig/network-scripts/route-eth0",
+        "/etc/sysconfig/network-scripts/ifup-eth",
+        "/etc/sysconfig/network-scripts/[brackets]",
+        "/etc/xensource/xapi.conf",
+        "/etc/xensource/db.conf",
+        "/var/empty/dir/.keep",
+    ):
+        fs.create_file(path, contents="content")
+    bugtool.cap("network", max_size=-1)
+    bugtool.cap("xenserver", max_size=-1)
+    bugtool.cap("etc", max_size=-1)
+    bugtool.cap("not-requested", max_size=-1)
+    mocker.patch.object(bugtool, "directory_specifications", bugtool.OrderedDict())
+    mocker.patch.object(bugtool, "entries", ["network", "xenserver", "etc", "not-requested"])
+    bugtool.tree_output("network", "/etc/sysconfig/network-scripts/", re.compile(r".*/ifcfg-"))
+    bugtool.tree_output("network", "/etc/sysconfig/network-scripts", re.compile(r".*/route-"))
+    bugtool.tree_output("network", "/etc/sysconfig/network-scripts", re.compile(r".*/\["))
+    bugtool.tree_output("etc", "/etc", re.compile(r".*\.conf$"))
+    bugtool.tree_output("xenserver", "/etc/xensource", re.compile(r".*/db\.conf"), True)
+    bugtool.tree_output("not-requested", "/var/empty")
+    bugtool.tree_output("network", "/nonexisting")
+    scandir = mocker.spy(os, "scandir")
+
+    bugtool.traverse_directory_specifications(
+        bugtool.directory_specifications, ["network", "xenserver", "etc"]
+    )
+
+    # Nested directories are walked as part of their parent, /var/empty is not requested:
+    assert sorted(call.args[0] for call in scandir.call_args_list) == [
+        "/etc",
+        "/etc/sysconfig",
+        "/etc/sysconfig/network-scripts",
+        "/etc/xensource",
+    ]
+    scripts = "/etc/sysconfig/network-scripts/"
+    expected_caps = {
+        scripts + "ifcfg-eth0": "network",
+        scripts + "route-eth0": "network",
+        scripts + "[brackets]": "network",
+        # Matched by the specs of /etc and of /etc/xensource, the last registered one wins:
+        "/etc/xensource/xapi.conf": "xenserver",
+        "/etc/xensource/db.conf": "etc",
+    }
+    assert bugtool.data == {path: {"cap": cap, "filename": path} for path, cap in expected_caps.items()}
+
+
+def test_size_of_dir(bugtool, fs):
+    """Assert that size_of_dir() sums the sizes of the matching files below the directory"""
+
+    fs.create_file("/var/crash/1/dump", contents="x" * 100)
+    fs.create_file("/var/crash/1/log", contents="x" * 10)
+    fs.create_file("/var/crash/2/log", contents="x" * 1)
+    assert bugtool.size_of_dir("/var/crash") == 111
+    assert bugtool.size_of_dir("/var/crash", re.compile(r".*/log$")) == 11
+    assert bugtool.size_of_dir("/var/crash", re.compile(r".*/log$"), True) == 100
+    assert bugtool.size_of_dir("/nonexisting") == 0
@@ -93,3 +93,36 @@ def test_filter_xenstore_secrets(bugtool):
     """Assert that filter_xenstore_secrets() does not filter non-secrets"""
 
     assert bugtool.filter_xenstore_secrets(b"not secret", "_") == b"not secret"
+
+
+def test_filter_db_pii_streaming(bugtool):
+    """Assert that filter_db_pii() filters the output of xe pool-dump-database in chunks"""
+
+    dumped = (
+        "Dumping database\n"
+        + original.replace('id="1"', "other_config=\"(('chap_password'%.'secret'))\" id=\"1\"", 1)
+    ).encode()
+    state = {}  # type: dict[str, object]
+    filtered = b"".join(
+        bugtool.filter_db_pii(dumped[i : i + 7], state) for i in range(0, len(dumped), 7)
+    ) + bugtool.filter_db_pii(b"", state)
+
+    assert b"secret" not in filtered.replace(b'name="secret"', b"")
+    assert b"(('chap_password'%.'REMOVED'))" in filtered
+    assert_xml_str_equiv(
+        filtered,
+        expected.replace('id="1"', "other_config=\"(('chap_password'%.'REMOVED'))\" id=\"1\"", 1),
+    )
+
+
+def test_dump_filtered_xapi_db(bugtool, fs, mocker):
+    """Assert that dump_filtered_xapi_db() writes the filtered database to a SpooledOutput"""
+
+    fs.create_file("/etc/xensource/db.conf", contents="[/var/lib/xcp/state.db]\n")
+    fs.create_file("/var/lib/xcp/state.db", contents=original)
+    mocker.patch.object(bugtool, "DB_CONF", "/etc/xensource/db.conf")
+    mocker.patch.object(bugtool, "PIPE_READ_SIZE", 16)
+
+    output = bugtool.dump_filtered_xapi_db("cap")
+    assert isinstance(output, bugtool.SpooledOutput)
+    assert_xml_str_equiv(output.getvalue(), expected)